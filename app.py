@@ -1,232 +1,236 @@
+import hashlib
+import uuid
+
 import streamlit as st
-from docx import Document
-from docx.shared import Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.enum.text import WD_COLOR_INDEX
-from openai import OpenAI
-client = OpenAI(
-  base_url="https://openrouter.ai/api/v1",
-  api_key=st.secrets["OPENROUTER_API_KEY"],
-  default_headers={
-    "HTTP-Referer": "https://report-generator.streamlit.app", # Твой адрес
-    "X-Title": "Report Generator"
-  }
+from artifacts import ArtifactStore
+from llm import CachedClient, LLMCache, make_openrouter_client, run_blocks
+from highlight import DEFAULT_KEYWORDS
+from jobs import JobManager
+from metrics import MeteredClient, Metrics
+from pipeline import run_report_pipeline
+from report import (
+    build_title_page, create_final_report, extract_requirements, extract_requisites,
+    get_contract_start_text, get_items_from_file, rewrite_full_text, smart_generate_step_strict,
 )
-GEMINI_MODEL = "anthropic/claude-3.5-sonnet"
+from segmenter import segment_items, segment_text
+
+# Сколько блоков ТЗ обрабатывается одновременно и сколько запросов в минуту разрешено
+MAX_CONCURRENCY = int(st.secrets.get("MAX_CONCURRENCY", 4))
+REQUESTS_PER_MINUTE = int(st.secrets.get("REQUESTS_PER_MINUTE", 60))
+# Сколько запросов к ИИ одновременно на весь сервер: все сессии, задания и этапы
+# конвейера вместе (клиент один на процесс). MAX_CONCURRENCY - предел одного запуска
+LLM_MAX_IN_FLIGHT = int(st.secrets.get("LLM_MAX_IN_FLIGHT", 8))
+# Дублировать запрос, если ответ задерживается дольше обычного (p95)
+LLM_HEDGE = bool(st.secrets.get("LLM_HEDGE", False))
+# Кэш ответов ИИ на диске
+LLM_CACHE_PATH = st.secrets.get("LLM_CACHE_PATH", "llm_cache.sqlite3")
+LLM_CACHE_MAX_MB = int(st.secrets.get("LLM_CACHE_MAX_MB", 200))
+LLM_CACHE_TTL_DAYS = int(st.secrets.get("LLM_CACHE_TTL_DAYS", 30))
+# Показывать текст по мере генерации (stream=True)
+STREAM_OUTPUT = bool(st.secrets.get("STREAM_OUTPUT", True))
+# Слова, которые подсвечиваются желтым в отчете (можно поменять в боковой панели).
+# В secrets - списком или строкой через запятую
+HIGHLIGHT_KEYWORDS = st.secrets.get("HIGHLIGHT_KEYWORDS", DEFAULT_KEYWORDS)
+if isinstance(HIGHLIGHT_KEYWORDS, str):
+    HIGHLIGHT_KEYWORDS = HIGHLIGHT_KEYWORDS.split(",")
+HIGHLIGHT_KEYWORDS = [w.strip() for w in HIGHLIGHT_KEYWORDS if w.strip()]
+# Фоновые задания пошаговой сборки: папка с контрольными точками и число одновременных заданий
+JOBS_DIR = st.secrets.get("JOBS_DIR", "jobs")
+MAX_JOBS = int(st.secrets.get("MAX_JOBS", 2))
+# Сколько дней и сколько штук хранить завершенные задания на диске
+JOBS_KEEP_DAYS = float(st.secrets.get("JOBS_KEEP_DAYS", 7))
+JOBS_MAX_KEPT = int(st.secrets.get("JOBS_MAX_KEPT", 50))
+# Крупные данные сессий (текст ТЗ, готовые DOCX) - на диске, общий бюджет на сервер
+ARTIFACTS_DIR = st.secrets.get("ARTIFACTS_DIR")
+ARTIFACTS_MAX_MB = int(st.secrets.get("ARTIFACTS_MAX_MB", 512))
+
+# Клиент и кэш общие для всех сессий и перезапусков скрипта
+@st.cache_resource
+def get_base_client():
+    # Потоковый ответ занимает место до конца чтения
+    return make_openrouter_client(st.secrets["OPENROUTER_API_KEY"], rpm=REQUESTS_PER_MINUTE,
+                                  max_in_flight=LLM_MAX_IN_FLIGHT, hedge=LLM_HEDGE)
+
+@st.cache_resource
+def get_llm_cache():
+    return LLMCache(LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024, ttl=LLM_CACHE_TTL_DAYS * 24 * 3600)
+
+@st.cache_resource
+def get_job_manager():
+    return JobManager(JOBS_DIR, get_base_client(), get_llm_cache(), MAX_JOBS, MAX_CONCURRENCY,
+                      keep_days=JOBS_KEEP_DAYS, max_kept=JOBS_MAX_KEPT)
+
+@st.cache_resource
+def get_artifact_store():
+    return ArtifactStore(ARTIFACTS_DIR, max_disk_bytes=ARTIFACTS_MAX_MB * 1024 * 1024)
+
+# В session_state остается только номер сессии, сами данные - в хранилище
+if "sid" not in st.session_state:
+    st.session_state.sid = uuid.uuid4().hex
+artifacts = get_artifact_store()
+
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+# Что сессия сохраняла: так отличаем вытесненные данные от еще не созданных
+if "artifact_names" not in st.session_state:
+    st.session_state.artifact_names = set()
+
+def save_artifact(name, value):
+    artifacts.put(st.session_state.sid, name, value)
+    if value is None:
+        st.session_state.artifact_names.discard(name)
+    else:
+        st.session_state.artifact_names.add(name)
+
+def artifact_evicted(name):
+    if name in st.session_state.artifact_names and not artifacts.has(st.session_state.sid, name):
+        st.warning("Данные сессии вытеснены из хранилища сервера (не хватило места). "
+                   "Загрузите ТЗ и сгенерируйте заново.")
+        st.session_state.artifact_names.discard(name)
+        return True
+    return False
+
+def load_artifact(name, default=None):
+    value = artifacts.get(st.session_state.sid, name)
+    if value is None:
+        artifact_evicted(name)
+        return default
+    return value
+
+def artifact_download(label, name, file_name, **kwargs):
+    # data - функция: файл читается из хранилища только по нажатию, а не на каждом
+    # перезапуске скрипта (иначе Streamlit держит байты в памяти до следующего)
+    sid = st.session_state.sid
+    if not artifact_evicted(name) and artifacts.has(sid, name):
+        st.download_button(label, lambda: artifacts.get(sid, name, b""), file_name, DOCX_MIME, **kwargs)
+
+def document_key(contract):
+    # Под этим ключом JobManager помнит последнее задание документа и берет из него блоки.
+    # Своя сессия + отпечаток контракта: другие сессии запись не перетирают,
+    # а правка ТЗ того же контракта остается тем же документом
+    digest = hashlib.sha256(contract.encode("utf-8")).hexdigest()[:16]
+    return f"{st.session_state.sid}:{digest}"
+
+def session_state_bytes():
+    # Сколько весит то, что сессия все же держит в памяти (тексты и байты в session_state)
+    return sum(len(v) for v in st.session_state.to_dict().values() if isinstance(v, (str, bytes)))
+
+# Замеры времени и токенов текущей сессии (панель "Замеры" в боковой панели)
+if "metrics" not in st.session_state:
+    st.session_state.metrics = Metrics()
+metrics = st.session_state.metrics
+
+# Галочка "Без кэша ИИ" в боковой панели отключает кэш для текущей сессии.
+# Замеры стоят под кэшем: считаются только настоящие запросы к ИИ
+client = CachedClient(MeteredClient(get_base_client(), metrics), get_llm_cache(),
+                      enabled=not st.session_state.get("no_llm_cache", False))
 import io
-import json
-import re
+import logging
+
+# Решения локальной проверки (verifier) пишутся в лог для аудита
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
 
 if "reset_counter" not in st.session_state:
     st.session_state.reset_counter = 0
 
-# --- 1. ФУНКЦИИ ПАРСИНГА (ТВОИ ОРИГИНАЛЬНЫЕ) ---
-
-def get_contract_start_text(file):
-    doc = Document(file)
-    full_text = []
-    for table in doc.tables:
-        for row in table.rows:
-            full_text.append(" ".join(cell.text.strip() for cell in row.cells))
-    for p in doc.paragraphs:
-        txt = p.text.strip()
-        if txt:
-            if re.match(r"^2\.", txt): 
-                break
-            full_text.append(txt)
-    return "\n".join(full_text)[:2000]
-
-def get_text_from_file(file):
-    doc = Document(file)
-    content = []
-    for p in doc.paragraphs:
-        if p.text.strip(): content.append(p.text)
-    for table in doc.tables:
-        for row in table.rows:
-            content.append(" ".join(cell.text.strip() for cell in row.cells))
-    return "\n".join(content)
-
-def format_fio_short(fio_str):
-    if not fio_str: return "___________"
-    parts = fio_str.split()
-    if len(parts) >= 3:
-        return f"{parts[0]} {parts[1][0]}.{parts[2][0]}."
-    return fio_str
-
-def clean_markdown(text):
-    return text.replace('**', '').replace('###', '').replace('##', '').replace('|', '').strip()
-
-# --- 2. УМНАЯ ГЕНЕРАЦИЯ (ЛОГИКА ВНУТРИ) ---
-
-def smart_generate_step_strict(section_text, requirements_text):
-    system_prompt = f"""Ты - юридический редактор. Перепиши пункты ТЗ в Отчет.
-    ПРАВИЛА:
-    1. ВРЕМЯ: У заголовком - настоящее, у текста - СТРОГО ПРОШЕДШЕЕ ('организовано', 'оказано', 'размещено').
-    2. ЗАПРЕТ: Слова 'должен', 'обязан', 'будет', 'необходимо' КАТЕГОРИЧЕСКИ ЗАПРЕЩЕНЫ.
-    3. ТОЧНОСТЬ: Перенеси ВСЕ цифры, площади, сроки и названия без изменений.
-    4. ПУНКТУАЦИЯ: Соблюдай правила русского языка. Не обрывай предложения.
-    ТРЕБОВАНИЯ К ДОКУМЕНТАМ: {requirements_text}"""
-
-    full_prompt = f"{system_prompt}\n\nТРАНСФОРМИРУЙ ЭТОТ КУСОК ТЗ В ОТЧЕТ:\n{section_text}"
-
-    # Шаг 1: Генерация
-    res = client.chat.completions.create(
-      model=GEMINI_MODEL,
-      messages=[{"role": "user", "content": full_prompt}]
-    )
-    draft = res.choices[0].message.content
-
-    # Шаг 2: ЖЕСТКИЙ КОНТРОЛЬ
-    v_prompt = f"Сравни ТЗ и Отчет. Если есть ошибки, напиши их. Если всё ок, пиши 'ОШИБОК: 0'.\nТЗ: {section_text}\nОТЧЕТ: {draft}"
-    v_res = client.chat.completions.create(
-        model=GEMINI_MODEL,
-        messages=[{"role": "user", "content": v_prompt}]
-    )
-    v_text = v_res.choices[0].message.content
-    
-    # Шаг 3: Исправление (если инспектор нашел брак)
-    if "ОШИБОК: 0" not in v_text:
-        fix_prompt = f"{system_prompt}\nИСПРАВЬ ОШИБКИ: {v_text}\nТЗ: {section_text}\nЧЕРНОВИК: {draft}"
-        fix = client.chat.completions.create(
-            model=GEMINI_MODEL,
-            messages=[{"role": "user", "content": fix_prompt}]
-        )
-        return fix.choices[0].message.content
-    return draft
-
-# --- 3. СБОРКА ДОКУМЕНТА (ТВОЕ ОФОРМЛЕНИЕ) ---
-
-def build_title_page(t):
-    doc = Document()
-    
-    # Настройка узких полей (чтобы точно влезло)
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Pt(36)    # 1.27 см
-        section.bottom_margin = Pt(36)
-        section.left_margin = Pt(72)   # 2.54 см
-        section.right_margin = Pt(36)
-
-    style = doc.styles['Normal']
-    style.font.name = 'Times New Roman'
-    style.font.size = Pt(12)
-    
-    # Сбор данных [cite: 151]
-    contract_no = t.get('contract_no', '___')
-    contract_date = t.get('contract_date', '___')
-    ikz = t.get('ikz', '___________')
-
-    # Шапка 
-    p = doc.add_paragraph()
-    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    p.add_run("Информационно-аналитический отчет об исполнении условий\n").bold = True
-    p.add_run(f"Контракта № {contract_no} от «{contract_date}» 2025 г.\n").bold = True
-    p.add_run(f"Идентификационный код закупки: {ikz}").bold = True
-
-    # Уменьшенный отступ перед ТОМ I
-    for _ in range(3): doc.add_paragraph() 
-    doc.add_paragraph("ТОМ I").alignment = WD_ALIGN_PARAGRAPH.CENTER
-
-    # Предмет, Заказчик, Исполнитель [cite: 3-8, 153-158]
-    for label, val in [
-        ("Наименование предмета КОНТРАКТА:", t.get('project_name')),
-        ("Заказчик:", t.get('customer')),
-        ("Исполнитель:", t.get('company'))
-    ]:
-        p_l = doc.add_paragraph()
-        p_l.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        p_l.add_run(f"\n{label}").bold = True
-        
-        p_v = doc.add_paragraph()
-        p_v.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        # Ограничиваем длину текста предмета, если он слишком длинный
-        p_v.add_run(str(val)).italic = True
-
-    # Динамический отступ перед подписями (уменьшен до 4)
-    for _ in range(4): doc.add_paragraph()
-    
-    # Таблица подписей [cite: 9, 159]
-    tab = doc.add_table(rows=2, cols=2)
-    tab.autofit = True
-
-    cust_post = str(t.get('customer_post', 'Заказчик')).capitalize()
-    exec_post = str(t.get('director_post', 'Исполнитель')).capitalize()
-    cust_fio = format_fio_short(t.get('customer_fio'))
-    exec_fio = format_fio_short(t.get('director'))
-
-    # Левая ячейка (Заказчик)
-    p1 = tab.rows[0].cells[0].paragraphs[0]
-    p1.add_run(f"Отчет принят Заказчиком\n{cust_post}\n\n___________ / {cust_fio}")
-    
-    # Правая ячейка (Исполнитель)
-    p2 = tab.rows[0].cells[1].paragraphs[0]
-    p2.add_run(f"Отчет передан Исполнителем\n{exec_post}\n\n___________ / {exec_fio}")
-
-    # М.П. (нижняя строка таблицы)
-    tab.rows[1].cells[0].text = "м.п."
-    tab.rows[1].cells[1].text = "м.п."
-
-    return doc
-    
-def apply_yellow_highlight(doc):
-    keywords = ["Акт", "Фотоотчет", "Ведомость", "Скриншот", "Смета", "Резюме", "USB", "Флеш-накопитель"]
-    for paragraph in doc.paragraphs:
-        for run in paragraph.runs:
-            for word in keywords:
-                if word.lower() in run.text.lower():
-                    run.font.highlight_color = WD_COLOR_INDEX.YELLOW
-
-def create_final_report(t, report_body, req_body):
-    doc = build_title_page(t)
-    doc.add_page_break()
-    
-    # Чтобы не было "Отчет об оказании услуг по услуг"
-    p_name = t.get('project_name', '')
-    if isinstance(p_name, dict): p_name = p_name.get('name', '')
-    p_name = str(p_name).strip() if p_name else "услугам"
-
-    head = doc.add_paragraph()
-    head.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    head.add_run(f"Отчет об оказании услуг по {p_name}").bold = True
-    
-    # Очищаем основной текст от дублей и пустых строк
-    lines = clean_markdown(report_body).split('\n')
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-        para = doc.add_paragraph()
-        run = para.add_run(line)
-        if re.match(r"^\d+\.", line): run.bold = True
-        para.alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        
-    if req_body:
-        doc.add_page_break()
-        p_req = doc.add_paragraph()
-        p_req.alignment = WD_ALIGN_PARAGRAPH.CENTER
-        p_req.add_run('ТРЕБОВАНИЯ К ПРЕДОСТАВЛЯЕМОЙ ДОКУМЕНТАЦИИ').bold = True
-        doc.add_paragraph(clean_markdown(req_body)).alignment = WD_ALIGN_PARAGRAPH.JUSTIFY
-        
-    apply_yellow_highlight(doc)
-    return doc
+def generate_blocks_with_progress(steps, requirements_text):
+    # Блоки идут параллельно; прогресс-бар и хвосты текущих блоков обновляются по ходу генерации
+    pb = st.progress(0)
+    status_text = st.empty()
+    stream = st.session_state.get("stream_llm", STREAM_OUTPUT)
+    live = {}
+    state = {"done": 0}
+
+    def work(indexed):
+        i, step = indexed
+        on_delta = (lambda text: live.__setitem__(i, text)) if stream else None
+        part = smart_generate_step_strict(client, step, requirements_text, on_delta=on_delta, metrics=metrics)
+        live.pop(i, None)
+        return part
+
+    def render():
+        lines = [f"Готово блоков: {state['done']} из {len(steps)}"]
+        for i, text in sorted(dict(live).items()):
+            tail = text[-150:].replace("\n", " ")
+            lines.append(f"Блок {i + 1}: …{tail}")
+        status_text.text("\n".join(lines))
+
+    def on_block_done(done, total):
+        state["done"] = done
+        pb.progress(done / total)
+        render()
+
+    with metrics.span("blocks", count=len(steps)):
+        return run_blocks(work, list(enumerate(steps)), MAX_CONCURRENCY, on_block_done, on_tick=render if stream else None)
 
 # --- 4. ИНТЕРФЕЙС (ВОЗВРАТ К ТВОЕЙ СТРУКТУРЕ) ---
 
 st.set_page_config(page_title="Генератор Отчетов 3.0", layout="wide")
 
+def current_keywords():
+    raw = st.session_state.get("hl_keywords", ", ".join(HIGHLIGHT_KEYWORDS))
+    return [w.strip() for w in raw.split(",") if w.strip()]
+
+# Streamlit перезапускает скрипт на каждое действие: разбор загруженных файлов
+# и титульник кэшируем по содержимому (ключ - хэш аргументов), старые записи вытесняются
+@st.cache_data(max_entries=32, show_spinner=False)
+def parse_contract_start(data):
+    with metrics.span("parse_contract"):
+        return get_contract_start_text(io.BytesIO(data))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def parse_tz_items(data):
+    with metrics.span("parse_tz"):
+        return get_items_from_file(io.BytesIO(data))
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def render_title_page(t):
+    buf = io.BytesIO()
+    build_title_page(t).save(buf)
+    return buf.getvalue()
+
+# Обновляется сама: фоновые задания дописывают замеры после перезапуска скрипта
+@st.fragment(run_every=5)
+def metrics_panel():
+    with st.expander("📊 Замеры"):
+        rows = metrics.summary()
+        if not rows:
+            st.caption("Пока пусто")
+            return
+        llm_rows = [r for r in rows if r["kind"] == "llm"]
+        st.caption(f"Запросов к ИИ: {sum(r['count'] for r in llm_rows)}, "
+                   f"токенов: {sum(r['prompt_tokens'] for r in llm_rows)} → {sum(r['completion_tokens'] for r in llm_rows)}")
+        st.dataframe(rows, hide_index=True, use_container_width=True)
+        # Выгрузка собирается по нажатию, а не на каждом обновлении панели
+        st.download_button("JSON", metrics.to_json, "metrics.json", "application/json", use_container_width=True)
+        st.download_button("CSV", metrics.to_csv, "metrics.csv", "text/csv", use_container_width=True)
+        if st.button("Очистить замеры", use_container_width=True):
+            metrics.clear()
+            st.rerun()
+
 with st.sidebar:
     st.title("Авторизация")
     if "auth" not in st.session_state: st.session_state.auth = False
     pwd = st.text_input("Пароль", type="password")
     if pwd == st.secrets["APP_PASSWORD"]: st.session_state.auth = True
     if not st.session_state.auth: st.stop()
+    st.checkbox("Без кэша ИИ", key="no_llm_cache")
+    st.checkbox("Потоковый вывод", value=STREAM_OUTPUT, key="stream_llm")
+    st.text_area("Слова для подсветки (через запятую)", ", ".join(HIGHLIGHT_KEYWORDS), key="hl_keywords", height=80)
+    c_stats = get_llm_cache().stats()
+    st.caption(f"Кэш ИИ: попаданий {c_stats['hits']}, промахов {c_stats['misses']}, "
+               f"записей {c_stats['entries']} ({c_stats['bytes'] / 1024 / 1024:.1f} МБ)")
+    a_stats = artifacts.stats(st.session_state.sid)
+    st.caption(f"Данные сессии: в хранилище {a_stats['memory_bytes'] / 1024:.0f} КБ в памяти и "
+               f"{a_stats['disk_bytes'] / 1024:.0f} КБ на диске, в session_state {session_state_bytes() / 1024:.0f} КБ")
+    metrics_panel()
     if st.button("♻️ СБРОСИТЬ ВСЕ ДАННЫЕ", use_container_width=True, type="primary"):
-        # 1. Полная очистка session_state
+        # 1. Полная очистка session_state и файлов сессии
+        artifacts.clear(st.session_state.sid)
         for key in list(st.session_state.keys()):
             if key != "reset_counter":
                 del st.session_state[key]
         
         # 2. Явное обнуление переменных кэша текста (чтобы ИИ не подтянул старое)
-        st.session_state.raw_tz_source = ""
         st.session_state.raw_report_body = ""
         st.session_state.raw_requirements = ""
         st.session_state.t_info = {}
@@ -238,8 +242,9 @@ with st.sidebar:
         # 3. Смена ключей виджетов (то, что мы делали со счетчиком)
         st.session_state.reset_counter += 1
         
-        # 4. Очистка кэша самого Streamlit (на всякий случай)
+        # 4. Очистка кэша самого Streamlit (на всякий случай) и списка заданий в адресе
         st.cache_data.clear()
+        st.query_params.clear()
         
         st.rerun()
     
@@ -255,7 +260,7 @@ with col1:
         f_title = st.file_uploader("Контракт (DOCX)", type="docx", key="u_title")
         t_context = "" # Инициализируем пустой строкой
         if f_title: 
-            t_context = get_contract_start_text(f_title)
+            t_context = parse_contract_start(f_title.getvalue())
     
     with t_tab2:
         # 1. Сначала определяем ключ текущего виджета
@@ -276,26 +281,7 @@ with col1:
     if st.button("🔍 Извлечь реквизиты", use_container_width=True):
         if t_context:
             with st.spinner("Ищем данные..."):
-                res = client.chat.completions.create(
-                    model=GEMINI_MODEL,
-                    messages=[{
-                        "role": "user", 
-                        "content": f"""Извлеки данные СТРОГО в формате JSON с этими ключами:
-                        'contract_no' (номер), 
-                        'contract_date' (дата), 
-                        'ikz' (ИКЗ), 
-                        'project_name' (предмет контракта), 
-                        'customer' (Заказчик), 
-                        'customer_post' (должность заказчика), 
-                        'customer_fio' (ФИО заказчика), 
-                        'company' (Исполнитель), 
-                        'director_post' (должность руководителя исполнителя), 
-                        'director' (ФИО руководителя исполнителя).
-                        Текст: {t_context}"""
-                    }],
-                    response_format={ "type": "json_object" }
-                )
-                st.session_state.t_info = json.loads(res.choices[0].message.content)
+                st.session_state.t_info = extract_requisites(client, t_context)
         else: st.error("Нет данных!")
 
     # --- ПРЕВЬЮ ТИТУЛЬНИКА (Редактируемое) ---
@@ -305,10 +291,10 @@ with col1:
         ti['contract_no'] = st.text_input("№", ti.get('contract_no'))
         ti['ikz'] = st.text_input("ИКЗ", ti.get('ikz'))
         ti['customer_fio'] = st.text_input("ФИО Заказчика", ti.get('customer_fio'))
-        # Кнопка скачивания только титульника
-        doc_t = build_title_page(ti)
-        buf_t = io.BytesIO(); doc_t.save(buf_t)
-        st.download_button("📥 Скачать Титульник", buf_t.getvalue(), "Title.docx", use_container_width=True)
+        # Кнопка скачивания только титульника: DOCX собирается по нажатию, как и остальные выгрузки
+        title_info = dict(ti)
+        st.download_button("📥 Скачать Титульник", lambda: render_title_page(title_info), "Title.docx", DOCX_MIME,
+                           use_container_width=True)
         
 # КОЛОНКА 2: ОТЧЕТ
 with col2:
@@ -332,78 +318,35 @@ with col2:
     if st.button("⚙️ Сгенерировать текст", use_container_width=True):
         # Берем текст из окна, если пусто - из файла
         tz_content = m_tz_area.strip() if m_tz_area.strip() else ""
+        tz_items = None
         if not tz_content and f_tz:
-            tz_content = get_text_from_file(f_tz)
+            tz_items = parse_tz_items(f_tz.getvalue())
+            tz_content = "\n".join(item["text"] for item in tz_items)
             
         if tz_content:
-            st.session_state.raw_tz_source = tz_content  # СОХРАНЯЕМ ДЛЯ ПОШАГОВОЙ СБОРКИ
-            seg_res = client.chat.completions.create(
-                model=GEMINI_MODEL,
-                messages=[{"role": "user", "content": f"Раздели на блоки с тегом [END_BLOCK]: {tz_content}"}]
-            )
-            steps = [s.strip() for s in seg_res.choices[0].message.content.split('[END_BLOCK]') if s.strip()]
-
-            instruction = """Роль и контекст:
-                    Ты — ассистент юриста по договорной работе. Перед тобой текст Технического Задания (ТЗ), который был написан в будущем времени как план работ. Сейчас его нужно превратить в черновик отчета о выполнении. Твоя задача — действовать как автомат по замене времени и удалению лишних слов, не меняя структуру и терминологию документа. Объём документа может быть очень большим (до 20 страниц) — это нормально, ты должен сохранить весь текст полностью, ничего не выбрасывая и не пересказывая.
-                    
-                    Инструкция (Что нужно сделать):
-                    Необходимо полностью переработать текст ТЗ в текст отчета, выполненного в прошедшем времени, со следующими важными исключениями.
-                    
-                    Правила обработки (Набор правил):
-                    
-                    Неприкосновенность заголовков (Важно!): Все заголовки пунктов и подпунктов ТЗ должны остаться в настоящем времени (как в оригинале). Их менять нельзя.
-                    
-                    Пример: Заголовок «Предоставление транспортных услуг...» должен остаться без изменений.
-                    
-                    Применяй это правило ко всем уровням заголовков.
-                    
-                    Основное время (Тело пунктов): Весь описательный текст, следующий за заголовком (внутри пункта), нужно переписать в прошедшее время.
-                    
-                    Пример: «Исполнитель организует доставку...» -> «Исполнитель организовал доставку...».
-                    
-                    Чистка текста (Удаление модального мусора): В отчете не должно быть слов, указывающих на долженствование или ограничения из ТЗ. Их нужно удалять или заменять, не искажая сути:
-                    
-                    Слова для удаления: должен, обязан, нужно, необходимо, следует.
-                    
-                    Пример: «Исполнитель обязан предоставить отчет» -> «Исполнитель предоставил отчет».
-                    
-                    Слова для удаления (если они не влияют на цифры): более, менее, не более, не менее, свыше (часто они просто указывают на план, в отчете важны конкретные цифры).
-                    
-                    Пример: «Поставлено не менее 10 ящиков» -> «Поставлено 10 ящиков» (если факт совпадает с минимумом; если поставлено больше, лучше сохранить факт: «Поставлено 12 ящиков»).
-                    
-                    Неизменность данных и объёма: Все, что не является глаголами или мусорными словами из п.3, должно остаться нетронутым:
-                    
-                    Сроки (числа), адреса, имена, названия организаций, специфические термины, номенклатурные номера — все остается как в оригинале ТЗ.
-                    
-                    Важно: ни в коем случае не сокращай текст, не убирай предложения, не пересказывай своими словами. Сохраняй исходный объём и все детали, даже если текст очень длинный. Просто заменяй времена и удаляй указанные слова.
-                    
-                    Работа с описаниями процессов: Длинные описания того, как надо делать, превращаются в описание того, как было сделано.
-                    
-                    Формат вывода:
-                    Выведи полностью переработанный текст. Начинай с первого заголовка документа. Не добавляй никаких вступлений, комментариев или пояснений в квадратных скобках. 
-                    Только чистый текст отчета."""
-            
-            # Вызываем Gemini с твоей инструкцией и текстом ТЗ
-            res = client.chat.completions.create(
-                model=GEMINI_MODEL,
-                messages=[{"role": "user", "content": f"{instruction}\n\n{tz_content}"}]
-            )
-            st.session_state.raw_report_body = res.choices[0].message.content
-            
-            # Сохраняем результат (у Gemini это res.text)
-            st.session_state.raw_report_body = res.choices[0].message.content
+            save_artifact("raw_tz_source", tz_content)  # СОХРАНЯЕМ ДЛЯ ПОШАГОВОЙ СБОРКИ
+            save_artifact("raw_tz_items", tz_items)     # структура DOCX (None для ручного текста)
+            # Разбивка на блоки локально, по структуре документа
+            with metrics.span("segmentation"):
+                steps = segment_items(tz_items) if tz_items else segment_text(tz_content)
+
+            # Вызываем модель с инструкцией и текстом ТЗ, текст появляется по мере генерации
+            live_draft = st.empty()
+            # Длинное ТЗ режется по пунктам под лимит токенов модели, куски идут параллельно
+            with metrics.span("rewrite"):
+                report_body = rewrite_full_text(
+                    client, tz_content, stream=st.session_state.get("stream_llm", STREAM_OUTPUT),
+                    on_delta=lambda text: live_draft.text(text), items=tz_items,
+                    max_workers=MAX_CONCURRENCY, on_warning=st.warning
+                )
+            live_draft.empty()
             
-            final_text_parts = []
-            pb = st.progress(0)
-            status_text = st.empty()
+            # Сохраняем результат
+            st.session_state.raw_report_body = report_body
             
-            for i, step in enumerate(steps):
-                status_text.text(f"Обработка блока {i+1} из {len(steps)}...")
-                part = smart_generate_step_strict(step, st.session_state.get('raw_requirements', ''))
-                final_text_parts.append(part)
-                pb.progress((i + 1) / len(steps))
+            final_text_parts = generate_blocks_with_progress(steps, st.session_state.get('raw_requirements', ''))
             
-            st.session_state.raw_report_body = res.choices[0].message.content
+            st.session_state.raw_report_body = report_body
         else:
             st.warning("Данные ТЗ отсутствуют")
 
@@ -414,52 +357,101 @@ with col2:
 with col3:
     st.header("📋 3. Требования")
     if st.button("🔍 Выделить требования", use_container_width=True):
-        if "raw_tz_source" in st.session_state:
-            res = client.chat.completions.create(
-                model=GEMINI_MODEL,
-                messages=[{"role": "user", "content": f"Выпиши требования к документам: {st.session_state.raw_tz_source}"}]
-            )
-            st.session_state.raw_requirements = res.choices[0].message.content
+        if load_artifact("raw_tz_source"):
+            st.session_state.raw_requirements = extract_requirements(client, load_artifact("raw_tz_source"))
 
     if "raw_requirements" in st.session_state:
         st.session_state.raw_requirements = st.text_area("Требования:", st.session_state.raw_requirements, height=300)
 
 # НИЖНИЙ БЛОК: СБОРКА
 st.divider()
+
+# Все этапы одной кнопкой: реквизиты, требования и разбивка идут параллельно,
+# блоки стартуют, как только готовы требования
+PIPELINE_STAGES = {
+    "requisites": "Реквизиты", "requirements": "Требования", "segmentation": "Разбивка на блоки",
+    "rewrite": "Черновик отчета", "blocks": "Пошаговые блоки", "report": "Обычный отчет", "smart_report": "Умный отчет",
+}
+if st.button("⚡ ВСЁ СРАЗУ: РЕКВИЗИТЫ, ТРЕБОВАНИЯ И ОТЧЕТЫ", use_container_width=True):
+    tz_content, tz_items = m_tz_area.strip(), None
+    if not tz_content and f_tz:
+        tz_items = parse_tz_items(f_tz.getvalue())
+        tz_content = "\n".join(item["text"] for item in tz_items)
+    if t_context and tz_content:
+        with st.status("Выполняем этапы...", expanded=True) as p_status:
+            # Блоки идут фоновым заданием: после обновления страницы повторный запуск возьмет готовые
+            result = run_report_pipeline(
+                client, get_job_manager(), t_context, tz_content, tz_items, current_keywords(), MAX_CONCURRENCY,
+                metrics, on_done=lambda name, secs: st.write(f"✅ {PIPELINE_STAGES[name]} ({secs:.1f} с)"),
+                doc_key=document_key(t_context)
+            )
+            p_status.update(label="Готово", state="complete")
+        st.session_state.t_info = result["requisites"]
+        save_artifact("raw_tz_source", tz_content)
+        save_artifact("raw_tz_items", tz_items)
+        st.session_state.raw_report_body = result["rewrite"]
+        st.session_state.raw_requirements = result["requirements"]
+        save_artifact("full_file", result["report"])
+        save_artifact("smart_file", result["smart_report"])
+        st.rerun()
+    else:
+        st.error("Нужны контракт (колонка 1) и ТЗ (колонка 2)")
+
 f_col1, f_col2 = st.columns(2)
 
 with f_col1:
     if st.button("🚀 СОБРАТЬ ПОЛНЫЙ ОТЧЕТ (КАК ЕСТЬ)", use_container_width=True):
         if "t_info" in st.session_state:
-            doc = create_final_report(st.session_state.t_info, st.session_state.get('raw_report_body', ''), st.session_state.get('raw_requirements', ''))
-            buf = io.BytesIO(); doc.save(buf)
-            st.session_state.full_file = buf.getvalue()
+            with metrics.span("create_final_report"):
+                doc = create_final_report(st.session_state.t_info, st.session_state.get('raw_report_body', ''), st.session_state.get('raw_requirements', ''), current_keywords())
+            with metrics.span("doc.save"):
+                buf = io.BytesIO(); doc.save(buf)
+            save_artifact("full_file", buf.getvalue())
 
 with f_col2:
     if st.button("🚀 ЗАПУСТИТЬ ПОШАГОВУЮ СБОРКУ", use_container_width=True):
-        if "t_info" in st.session_state and st.session_state.get('raw_tz_source'):
+        tz_source = load_artifact("raw_tz_source")
+        if "t_info" in st.session_state and tz_source:
             
-            # Разрезаем по пунктам типа 1.1., 2.1.
-            steps = [s.strip() for s in re.split(r'\n(?=\d+\.\d+)', st.session_state.raw_tz_source) if s.strip()]
+            # Разрезаем по пунктам (1.1., 2.1.) и заголовкам, таблицы остаются в своем пункте
+            tz_items = load_artifact("raw_tz_items")
+            steps = segment_items(tz_items) if tz_items else segment_text(tz_source)
             
-            final_text_parts = []
-            pb = st.progress(0)
-            for i, step in enumerate(steps):
-                part = smart_generate_step_strict(step, st.session_state.get('raw_requirements', ''))
-                final_text_parts.append(part)
-                pb.progress((i + 1) / len(steps))
-            
-            # Соединяем один раз
-            full_smart_text = "\n\n".join(final_text_parts)
-            doc = create_final_report(st.session_state.t_info, full_smart_text, st.session_state.get('raw_requirements', ''))
-            buf = io.BytesIO()
-            doc.save(buf)
-            st.session_state.smart_file = buf.getvalue()
-            st.success("Умная сборка завершена!")
-if "full_file" in st.session_state:
-    st.download_button("📥 Скачать обычный", st.session_state.full_file, "Report.docx")
-if "smart_file" in st.session_state:
-    st.download_button("📥 СКАЧАТЬ УМНЫЙ ОТЧЕТ", st.session_state.smart_file, "Smart_Report.docx")
+            # Сборка идет фоновым заданием: переживает обновление страницы,
+            # каждый готовый блок сохраняется на диск. Неизмененные с прошлой
+            # сборки этого контракта блоки берутся готовыми
+            contract_no = str(st.session_state.t_info.get('contract_no') or '')
+            job_id = get_job_manager().create(
+                steps, st.session_state.get('raw_requirements', ''), dict(st.session_state.t_info),
+                current_keywords(), title=contract_no, doc_key=document_key(t_context or contract_no), metrics=metrics
+            )
+            # Номера заданий храним в адресе страницы, чтобы найти их после перезагрузки
+            job_ids = [j for j in st.query_params.get("jobs", "").split(",") if j]
+            st.query_params["jobs"] = ",".join(job_ids + [job_id])
+
+@st.fragment(run_every=2)
+def show_jobs():
+    manager = get_job_manager()
+    for job_id in [j for j in st.query_params.get("jobs", "").split(",") if j]:
+        job = manager.status(job_id)
+        if job is None: continue
+        label = f"Пошаговая сборка {job['title'] or job_id}"
+        if job["status"] == "done":
+            st.download_button(f"📥 СКАЧАТЬ УМНЫЙ ОТЧЕТ ({job['title'] or job_id})",
+                               lambda job_id=job_id: manager.result(job_id), "Smart_Report.docx",
+                               DOCX_MIME, key=f"dl_{job_id}")
+        elif job["status"] == "failed" or not job["active"]:
+            st.error(f"{label}: прервана на блоке {job['done'] + 1} из {job['total']}. {job['error'] or ''}")
+            if st.button("▶️ Продолжить", key=f"resume_{job_id}"):
+                manager.resume(job_id)
+        else:
+            reused = f" (без изменений: {job['reused']})" if job.get("reused") else ""
+            st.progress(job["done"] / max(job["total"], 1),
+                        text=f"{label}: готово блоков {job['done']} из {job['total']}{reused}")
+
+show_jobs()
+artifact_download("📥 Скачать обычный", "full_file", "Report.docx")
+artifact_download("📥 СКАЧАТЬ УМНЫЙ ОТЧЕТ", "smart_file", "Smart_Report.docx")
 
 
 
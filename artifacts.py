@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+# --- ХРАНИЛИЩЕ БОЛЬШИХ ДАННЫХ СЕССИЙ ---
+# Текст ТЗ, структура DOCX и готовые отчеты не держим в st.session_state:
+# мелкие значения остаются в памяти, крупные пишутся во временную папку.
+# Общий бюджет диска на все сессии; при превышении удаляются давно не
+# читанные файлы (LRU). Вытесненное значение пропадает - как после сброса; app.py
+# помнит, что сохраняла сессия, и предупреждает пользователя.
+
+log = logging.getLogger(__name__)
+
+SAFE_RE = re.compile(r"[^\w.-]")
+
+
+def _encode(value):
+    if isinstance(value, bytes):
+        return "bytes", value
+    if isinstance(value, str):
+        return "text", value.encode("utf-8")
+    return "json", json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(kind, data):
+    if kind == "bytes":
+        return data
+    if kind == "text":
+        return data.decode("utf-8")
+    return json.loads(data)
+
+
+class ArtifactStore:
+    # inline_bytes - до какого размера значение остается в памяти;
+    # max_memory_bytes / max_disk_bytes - общие бюджеты на все сессии
+    def __init__(self, root=None, max_disk_bytes=512 * 1024 * 1024, max_memory_bytes=32 * 1024 * 1024,
+                 inline_bytes=64 * 1024):
+        self.root = Path(root) if root else Path(tempfile.mkdtemp(prefix="report_artifacts_"))
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = {"memory": max_memory_bytes, "disk": max_disk_bytes}
+        self.inline_bytes = inline_bytes
+        self.lock = threading.Lock()
+        # (сессия, имя) -> (вид, размер, данные или None, если на диске); порядок - LRU
+        self.entries = OrderedDict()
+        self.used = {"memory": 0, "disk": 0}
+
+    def _path(self, key):
+        return self.root / SAFE_RE.sub("_", f"{key[0]}__{key[1]}")
+
+    def _drop(self, key):
+        # Вызывается под self.lock
+        if key not in self.entries:
+            return
+        _, size, data = self.entries.pop(key)
+        if data is None:
+            self.used["disk"] -= size
+            self._path(key).unlink(missing_ok=True)
+        else:
+            self.used["memory"] -= size
+
+    def _evict(self, where):
+        while self.used[where] > self.max_bytes[where]:
+            old = next((k for k, e in self.entries.items() if (e[2] is None) == (where == "disk")), None)
+            if old is None:
+                return
+            log.info("artifact evicted (%s): %s/%s", where, *old)
+            self._drop(old)
+
+    def put(self, session, name, value):
+        key = (session, name)
+        if value is None:
+            self.delete(session, name)
+            return
+        kind, data = _encode(value)
+        with self.lock:
+            self._drop(key)
+            if len(data) <= self.inline_bytes:
+                self.entries[key] = (kind, len(data), data)
+                self.used["memory"] += len(data)
+                self._evict("memory")
+                return
+            path = self._path(key)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+            self.entries[key] = (kind, len(data), None)
+            self.used["disk"] += len(data)
+            self._evict("disk")
+
+    def _lookup(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            kind, _, data = self.entries[key]
+            return kind, data, self._path(key)
+
+    def get(self, session, name, default=None):
+        found = self._lookup((session, name))
+        if found is None:
+            return default
+        kind, data, path = found
+        try:
+            return _decode(kind, data if data is not None else path.read_bytes())
+        except FileNotFoundError:
+            return default
+
+    def has(self, session, name):
+        with self.lock:
+            return (session, name) in self.entries
+
+    def delete(self, session, name):
+        with self.lock:
+            self._drop((session, name))
+
+    def clear(self, session):
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == session]:
+                self._drop(key)
+
+    def stats(self, session=None):
+        with self.lock:
+            entries = [(k, size, data is None) for k, (_, size, data) in self.entries.items()]
+            used = dict(self.used)
+        own = [(size, on_disk) for k, size, on_disk in entries if session is None or k[0] == session]
+        return {
+            "entries": len(own),
+            "memory_bytes": sum(size for size, on_disk in own if not on_disk),
+            "disk_bytes": sum(size for size, on_disk in own if on_disk),
+            "total_memory_bytes": used["memory"], "total_disk_bytes": used["disk"],
+        }
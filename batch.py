@@ -0,0 +1,181 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+from highlight import DEFAULT_KEYWORDS
+from llm import CachedClient, LLMCache, make_openrouter_client, run_blocks
+from metrics import MeteredClient, Metrics
+from report import (
+    build_title_page, create_final_report, extract_requirements, extract_requisites,
+    get_contract_start_text, get_items_from_file, rewrite_full_text, smart_generate_step_strict,
+)
+from segmenter import segment_items
+
+# --- ПАКЕТНАЯ ОБРАБОТКА БЕЗ ИНТЕРФЕЙСА ---
+#   python batch.py --contracts contracts/ --tz tz/ --out reports/
+#   python batch.py --pair contract.docx tz.docx --pair ... --out reports/
+# Пары из папок сопоставляются по имени файла. Для каждой пары в out/<имя>/
+# пишутся Title.docx, Report.docx, Smart_Report.docx и metrics.json (время
+# этапов и токены запросов). Ответы ИИ по этапам
+# сохраняются в out/manifest.json: после сбоя повторный запуск пропускает
+# готовые документы и уже полученные ответы.
+
+log = logging.getLogger("batch")
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.lock = threading.Lock()
+        self.data = json.loads(self.path.read_text(encoding="utf-8")) if self.path.exists() else {}
+
+    def get(self, name):
+        with self.lock:
+            return dict(self.data.get(name, {}))
+
+    def update(self, name, **fields):
+        # Пишем во временный файл и подменяем, чтобы манифест не побился при падении
+        with self.lock:
+            self.data.setdefault(name, {}).update(fields)
+            tmp = self.path.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.data, ensure_ascii=False, indent=2), encoding="utf-8")
+            os.replace(tmp, self.path)
+
+
+def find_pairs(args):
+    pairs = [(Path(c), Path(t)) for c, t in args.pair or []]
+    if args.contracts and args.tz:
+        tz_by_stem = {p.stem: p for p in Path(args.tz).glob("*.docx")}
+        for contract in sorted(Path(args.contracts).glob("*.docx")):
+            if contract.stem in tz_by_stem:
+                pairs.append((contract, tz_by_stem[contract.stem]))
+            else:
+                log.warning("Нет ТЗ для %s", contract.name)
+    named, seen = [], {}
+    for contract, tz in pairs:
+        name = contract.stem
+        seen[name] = seen.get(name, 0) + 1
+        named.append((name if seen[name] == 1 else f"{name}_{seen[name]}", contract, tz))
+    return named
+
+
+# Этапы без ИИ (разбор и сборка DOCX) идут в пуле процессов
+
+def parse_inputs(contract_path, tz_path):
+    return get_contract_start_text(contract_path), get_items_from_file(tz_path)
+
+
+def build_outputs(out_dir, t_info, report_body, smart_body, requirements, keywords):
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    build_title_page(t_info).save(out_dir / "Title.docx")
+    create_final_report(t_info, report_body, requirements, keywords).save(out_dir / "Report.docx")
+    create_final_report(t_info, smart_body, requirements, keywords).save(out_dir / "Smart_Report.docx")
+    return [str(out_dir / n) for n in ("Title.docx", "Report.docx", "Smart_Report.docx")]
+
+
+def process_pair(name, contract, tz, base, cache, cpu_pool, manifest, args):
+    state = manifest.get(name)
+    if state.get("status") == "done":
+        log.info("%s: уже готов, пропускаем", name)
+        return state
+    manifest.update(name, status="running", contract=str(contract), tz=str(tz))
+    metrics = Metrics()
+    client = CachedClient(MeteredClient(base, metrics), cache, enabled=not args.no_cache)
+    try:
+        return _process_pair(name, contract, tz, client, metrics, cpu_pool, manifest, args, state)
+    finally:
+        out_dir = Path(args.out) / name
+        out_dir.mkdir(parents=True, exist_ok=True)
+        (out_dir / "metrics.json").write_text(metrics.to_json(), encoding="utf-8")
+
+
+def _process_pair(name, contract, tz, client, metrics, cpu_pool, manifest, args, state):
+    with metrics.span("parse"):
+        contract_text, tz_items = cpu_pool.submit(parse_inputs, str(contract), str(tz)).result()
+    tz_text = "\n".join(item["text"] for item in tz_items)
+
+    def stage(key, func):
+        # Результат этапа сохраняется сразу, повторный запуск его не пересчитывает
+        if key not in state:
+            log.info("%s: %s", name, key)
+            with metrics.span(key):
+                state[key] = func()
+            manifest.update(name, **{key: state[key]})
+        return state[key]
+
+    t_info = stage("t_info", lambda: extract_requisites(client, contract_text))
+    requirements = stage("requirements", lambda: extract_requirements(client, tz_text))
+    report_body = stage("report_body", lambda: rewrite_full_text(
+        client, tz_text, items=tz_items, max_workers=args.llm_concurrency,
+        on_warning=lambda w: log.warning("%s: %s", name, w),
+    ))
+    smart_body = stage("smart_body", lambda: "\n\n".join(run_blocks(
+        lambda step: smart_generate_step_strict(client, step, requirements, metrics=metrics),
+        segment_items(tz_items), args.llm_concurrency,
+    )))
+    with metrics.span("build_outputs"):
+        outputs = cpu_pool.submit(
+            build_outputs, str(Path(args.out) / name), t_info, report_body, smart_body, requirements, args.keywords
+        ).result()
+    manifest.update(name, status="done", outputs=outputs)
+    log.info("%s: готово", name)
+    return manifest.get(name)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетная генерация отчетов из контрактов и ТЗ (DOCX)")
+    parser.add_argument("--pair", nargs=2, action="append", metavar=("CONTRACT", "TZ"), help="контракт и ТЗ")
+    parser.add_argument("--contracts", help="папка с контрактами")
+    parser.add_argument("--tz", help="папка с ТЗ (имена файлов как у контрактов)")
+    parser.add_argument("--out", default="reports", help="куда писать отчеты и manifest.json")
+    parser.add_argument("--jobs", type=int, default=4, help="сколько документов обрабатывать одновременно")
+    parser.add_argument("--llm-concurrency", type=int, default=8, help="сколько запросов к ИИ одновременно (на все документы)")
+    parser.add_argument("--rpm", type=int, default=60, help="запросов к ИИ в минуту")
+    parser.add_argument("--cpu-workers", type=int, default=os.cpu_count() or 1, help="процессов для разбора/сборки DOCX")
+    parser.add_argument("--hedge", action="store_true", help="дублировать задержавшиеся запросы к ИИ")
+    parser.add_argument("--cache", default="llm_cache.sqlite3", help="файл кэша ответов ИИ")
+    parser.add_argument("--no-cache", action="store_true", help="не использовать кэш ИИ")
+    parser.add_argument("--keywords", type=lambda s: [w.strip() for w in s.split(",") if w.strip()],
+                        default=DEFAULT_KEYWORDS, help="слова для подсветки через запятую")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    pairs = find_pairs(args)
+    if not pairs:
+        parser.error("не найдено ни одной пары контракт/ТЗ")
+    api_key = os.environ.get("OPENROUTER_API_KEY")
+    if not api_key:
+        parser.error("не задан OPENROUTER_API_KEY")
+
+    Path(args.out).mkdir(parents=True, exist_ok=True)
+    manifest = Manifest(Path(args.out) / "manifest.json")
+    base = make_openrouter_client(api_key, rpm=args.rpm, max_in_flight=args.llm_concurrency, hedge=args.hedge)
+    cache = LLMCache(args.cache)
+
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.cpu_workers)) as cpu_pool, \
+            ThreadPoolExecutor(max_workers=max(1, args.jobs)) as doc_pool:
+        futures = {
+            doc_pool.submit(process_pair, name, contract, tz, base, cache, cpu_pool, manifest, args): name
+            for name, contract, tz in pairs
+        }
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                fut.result()
+            except Exception as e:
+                failed += 1
+                log.exception("%s: ошибка", name)
+                manifest.update(name, status="failed", error=str(e))
+    log.info("Готово: %d из %d", len(pairs) - failed, len(pairs))
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,271 @@
+import argparse
+import io
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from docx import Document
+
+from jobs import JobManager
+from llm import make_openrouter_client
+from metrics import MeteredClient, Metrics
+from report import (
+    REWRITE_INSTRUCTION, apply_yellow_highlight, create_final_report, extract_requirements, extract_requisites,
+    get_contract_start_text, get_items_from_file, get_text_from_file, rewrite_full_text,
+)
+from requisites import local_requisites
+from segmenter import segment_items
+from tokens import estimate_tokens
+
+# --- ЗАМЕРЫ ПРОИЗВОДИТЕЛЬНОСТИ БЕЗ СЕТИ ---
+#   python bench.py --sizes 10,50,200 --latency 0.2 --out bench_results.json
+# Генерирует контракты и ТЗ (пункты 1. / 1.1., таблицы) нескольких размеров,
+# замеряет разбор, разбивку, подсветку и сборку DOCX, затем прогоняет весь
+# конвейер (реквизиты, требования, переработка, пошаговая сборка) через
+# локальный сервер, который отвечает как OpenAI с заданной задержкой.
+# Результат - JSON: его можно сравнить между версиями.
+
+WORDS = ("услуги", "мероприятие", "участники", "площадка", "транспорт", "организация", "питание",
+         "размещение", "сопровождение", "оборудование", "материалы", "программа", "проведение")
+
+REQUISITES = {
+    "contract_no": "0373200001", "contract_date": "01.03.2025", "ikz": "252770100000077010100100010000000000",
+    "project_name": "оказание услуг по организации мероприятия", "customer": "ГБУ «Заказчик»",
+    "customer_post": "директор", "customer_fio": "Иванов Иван Иванович", "company": "ООО «Исполнитель»",
+    "director_post": "генеральный директор", "director": "Петров Петр Петрович",
+}
+# В контракте ФИО стоят в родительном падеже ("в лице директора Иванова Ивана Ивановича")
+GENITIVE_FIO = {"customer_fio": "Иванова Ивана Ивановича", "director": "Петрова Петра Петровича"}
+
+
+def sentence(rng, n):
+    words = [rng.choice(WORDS) for _ in range(8)]
+    return f"Исполнитель должен обеспечить {' '.join(words)} в количестве {n} шт. на площади {n * 3} кв. м."
+
+
+def make_contract(path, paragraphs, rng):
+    doc = Document()
+    doc.add_paragraph(f"КОНТРАКТ № {REQUISITES['contract_no']}", style="Title")
+    doc.add_paragraph(f"г. Москва {REQUISITES['contract_date']}")
+    doc.add_paragraph(f"Идентификационный код закупки: {REQUISITES['ikz']}")
+    # Обычный порядок: "именуемое «...»" раньше "в лице"
+    doc.add_paragraph(f"{REQUISITES['customer']}, именуемое в дальнейшем «Заказчик», в лице директора "
+                      f"{GENITIVE_FIO['customer_fio']}, действующего на основании Устава, с одной стороны, и "
+                      f"{REQUISITES['company']}, именуемое в дальнейшем «Исполнитель», в лице генерального директора "
+                      f"{GENITIVE_FIO['director']}, действующего на основании Устава, с другой стороны, "
+                      f"заключили настоящий Контракт о нижеследующем:")
+    for i in range(paragraphs):
+        doc.add_paragraph(sentence(rng, i + 1))
+    doc.save(path)
+
+
+def make_tz(path, sections, rng, clauses=5, table_every=3):
+    doc = Document()
+    doc.add_paragraph("ТЕХНИЧЕСКОЕ ЗАДАНИЕ", style="Heading 1")
+    for s in range(1, sections + 1):
+        doc.add_paragraph(f"{s}. Требования к {rng.choice(WORDS)}", style="Heading 2")
+        for c in range(1, clauses + 1):
+            doc.add_paragraph(f"{s}.{c}. {sentence(rng, s * 10 + c)} {sentence(rng, c)}")
+        if s % table_every == 0:
+            table = doc.add_table(rows=4, cols=3)
+            for r, row in enumerate(table.rows):
+                for k, cell in enumerate(row.cells):
+                    cell.text = f"{rng.choice(WORDS)} {s}.{r}.{k}"
+    doc.save(path)
+
+
+# --- ЛОКАЛЬНЫЙ СЕРВЕР, СОВМЕСТИМЫЙ С OPENAI ---
+
+def fake_answer(body):
+    prompt = body["messages"][-1]["content"]
+    if body.get("response_format"):
+        return json.dumps(REQUISITES, ensure_ascii=False)
+    if prompt.startswith("Выпиши требования"):
+        return "Отчет представляется в 2 экземплярах с фотоматериалами."
+    if prompt.startswith("Сравни ТЗ и Отчет"):
+        return "ОШИБОК: 0"
+    if prompt.startswith(REWRITE_INSTRUCTION):
+        return prompt[len(REWRITE_INSTRUCTION):].strip().replace("должен обеспечить", "обеспечил")
+    for marker in ("ЧЕРНОВИК: ", "ТРАНСФОРМИРУЙ ЭТОТ КУСОК ТЗ В ОТЧЕТ:\n"):
+        if marker in prompt:
+            return prompt.split(marker, 1)[1].replace("должен обеспечить", "обеспечил")
+    return "ok"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+    jitter = 0.0
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        answer = fake_answer(body)
+        usage = {"prompt_tokens": estimate_tokens(body["messages"][-1]["content"]),
+                 "completion_tokens": estimate_tokens(answer)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        base = {"id": "bench", "created": int(time.time()), "model": body.get("model", "bench")}
+        if not body.get("stream"):
+            time.sleep(delay)
+            self._send(200, "application/json", json.dumps({
+                **base, "object": "chat.completion", "usage": usage,
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+            }).encode())
+            return
+        # Поток: первый кусок после половины задержки, остальное равномерно
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [answer[i:i + 200] for i in range(0, len(answer), 200)] or [""]
+        time.sleep(delay / 2)
+        chunks = [{**base, "object": "chat.completion.chunk", "choices": [
+            {"index": 0, "delta": {"content": piece}, "finish_reason": "stop" if i == len(pieces) - 1 else None}
+        ]} for i, piece in enumerate(pieces)]
+        # Как у OpenAI: токены в потоке - отдельным последним куском и только по запросу
+        if (body.get("stream_options") or {}).get("include_usage"):
+            chunks.append({**base, "object": "chat.completion.chunk", "choices": [], "usage": usage})
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            self.wfile.flush()
+            time.sleep(delay / 2 / len(chunks))
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send(self, code, content_type, data):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_fake_llm(latency, jitter=0.0, handler=FakeLLMHandler, **attrs):
+    # handler - подкласс FakeLLMHandler (например, в тестах), attrs - его атрибуты класса
+    handler = type("Handler", (handler,), {"latency": latency, "jitter": jitter, **attrs})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+# --- ЗАМЕРЫ ---
+
+def timed(name, size, func, repeat, setup=None):
+    runs = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        func(arg) if setup else func()
+        runs.append(time.perf_counter() - start)
+    return {"name": name, "size": size, "runs": repeat, "min": round(min(runs), 5),
+            "median": round(statistics.median(runs), 5), "mean": round(statistics.fmean(runs), 5)}
+
+
+def bench_local(contract, tz, size, repeat):
+    items = get_items_from_file(tz)
+    tz_text = get_text_from_file(tz)
+    results = [
+        timed("get_contract_start_text", size, lambda: get_contract_start_text(contract), repeat),
+        timed("get_text_from_file", size, lambda: get_text_from_file(tz), repeat),
+        timed("segmentation", size, lambda: segment_items(items), repeat),
+        timed("apply_yellow_highlight", size, apply_yellow_highlight, repeat, setup=lambda: Document(tz)),
+        timed("create_final_report", size, lambda: create_final_report(REQUISITES, tz_text, "Требования"), repeat),
+        timed("doc.save", size, lambda doc: doc.save(io.BytesIO()), repeat,
+              setup=lambda: create_final_report(REQUISITES, tz_text, "Требования")),
+    ]
+    for r in results:
+        r["chars"] = len(tz_text)
+    return results
+
+
+def bench_pipeline(contract, tz, size, url, args, work_dir):
+    metrics = Metrics()
+    base = make_openrouter_client("bench", rpm=0, max_in_flight=args.concurrency, base_url=url)
+    client = MeteredClient(base, metrics)
+    start = time.perf_counter()
+    with metrics.span("parse"):
+        contract_text = get_contract_start_text(contract)
+        items = get_items_from_file(tz)
+        tz_text = "\n".join(item["text"] for item in items)
+    with metrics.span("requisites"):
+        t_info = extract_requisites(client, contract_text)
+    with metrics.span("requirements"):
+        requirements = extract_requirements(client, tz_text)
+    with metrics.span("rewrite"):
+        rewrite_full_text(client, tz_text, stream=args.stream, items=items, max_workers=args.concurrency)
+    with metrics.span("segmentation"):
+        steps = segment_items(items)
+    # Пошаговая сборка - тем же фоновым заданием, что и в приложении
+    manager = JobManager(Path(work_dir) / f"jobs_{size}", base, max_jobs=1, block_workers=args.concurrency)
+    with metrics.span("job", blocks=len(steps)):
+        job_id = manager.create(steps, requirements, t_info, metrics=metrics)
+        while manager.status(job_id)["status"] not in ("done", "failed"):
+            time.sleep(0.05)
+    status = manager.status(job_id)
+    manager.pool.shutdown()
+    # Поля, где локальное извлечение разошлось с эталоном (фейковый ИИ отвечает эталоном)
+    wrong = sorted(key for key, value in REQUISITES.items() if t_info.get(key) != value)
+    return {"size": size, "chars": len(tz_text), "blocks": len(steps), "status": status["status"],
+            "requisites_local": sorted(local_requisites(contract_text)), "requisites_wrong": wrong,
+            "error": status["error"], "seconds": round(time.perf_counter() - start, 4), "summary": metrics.summary()}
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры скорости на сгенерированных документах и локальном сервере ИИ")
+    parser.add_argument("--sizes", default="10,50,200",
+                        help="размеры ТЗ через запятую (число разделов по 5 пунктов)")
+    parser.add_argument("--repeat", type=int, default=3, help="повторов каждого локального замера")
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа сервера ИИ, сек")
+    parser.add_argument("--jitter", type=float, default=0.05, help="разброс задержки, сек")
+    parser.add_argument("--concurrency", type=int, default=4, help="сколько запросов к ИИ одновременно")
+    parser.add_argument("--stream", action="store_true", help="переработка ТЗ потоком")
+    parser.add_argument("--no-pipeline", action="store_true", help="только локальные замеры, без сервера ИИ")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json", help="файл с результатами (JSON)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    rng = random.Random(args.seed)
+    results = {
+        "meta": {"revision": git_revision(), "python": platform.python_version(), "platform": platform.platform(),
+                 "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)},
+        "local": [], "pipeline": [],
+    }
+    server, url = (None, None) if args.no_pipeline else start_fake_llm(args.latency, args.jitter)
+    with tempfile.TemporaryDirectory() as work_dir:
+        for size in sizes:
+            contract, tz = Path(work_dir) / f"contract_{size}.docx", Path(work_dir) / f"tz_{size}.docx"
+            make_contract(contract, size * 2, rng)
+            make_tz(tz, size, rng)
+            for r in bench_local(str(contract), str(tz), size, args.repeat):
+                results["local"].append(r)
+                print(f"{r['name']:<24} size={size:<5} median={r['median']:.4f}s", file=sys.stderr)
+            if server:
+                r = bench_pipeline(str(contract), str(tz), size, url, args, work_dir)
+                results["pipeline"].append(r)
+                print(f"{'pipeline':<24} size={size:<5} total={r['seconds']:.2f}s {r['status']}"
+                      f" requisites local={len(r['requisites_local'])} wrong={len(r['requisites_wrong'])}", file=sys.stderr)
+    if server:
+        server.shutdown()
+    Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0 if all(r["status"] == "done" and not r["requisites_wrong"] for r in results["pipeline"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
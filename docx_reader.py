@@ -0,0 +1,140 @@
+import xml.etree.ElementTree as ET
+import zipfile
+
+from segmenter import clause_level
+
+# --- ПОТОКОВОЕ ЧТЕНИЕ DOCX ---
+# Один проход по word/document.xml: абзацы и строки таблиц выдаются в порядке
+# документа, разобранные элементы сразу выбрасываются. Память зависит от размера
+# одного абзаца/строки, а не от размера файла; чтение можно прервать в любой момент.
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+W_BODY, W_P, W_TBL, W_TR, W_TC = W + "body", W + "p", W + "tbl", W + "tr", W + "tc"
+W_T, W_TAB, W_BR, W_CR = W + "t", W + "tab", W + "br", W + "cr"
+W_PPR, W_RPR, W_PSTYLE, W_NUMPR, W_ILVL, W_VAL = W + "pPr", W + "rPr", W + "pStyle", W + "numPr", W + "ilvl", W + "val"
+W_STYLE, W_NAME, W_STYLE_ID = W + "style", W + "name", W + "styleId"
+W_NUM_ID, W_NUM, W_ABSTRACT_NUM, W_ABSTRACT_NUM_ID = W + "numId", W + "num", W + "abstractNum", W + "abstractNumId"
+W_LVL, W_LVL_OVERRIDE, W_NUM_FMT = W + "lvl", W + "lvlOverride", W + "numFmt"
+
+HEADING_STYLES = ("heading", "заголовок", "title")
+
+
+def _style_names(zf):
+    # styleId -> имя стиля (в русском Word у заголовков styleId бывает "1", "2"...)
+    try:
+        root = ET.fromstring(zf.read("word/styles.xml"))
+    except KeyError:
+        return {}
+    names = {}
+    for style in root.iter(W_STYLE):
+        name = style.find(W_NAME)
+        names[style.get(W_STYLE_ID)] = name.get(W_VAL) if name is not None else ""
+    return names
+
+
+def _bullet_levels(zf):
+    # {(numId, ilvl)} маркированных списков: у них numFmt="bullet", это не пункты ТЗ
+    try:
+        root = ET.fromstring(zf.read("word/numbering.xml"))
+    except KeyError:
+        return set()
+
+    def bullets(parent):
+        return {lvl.get(W + "ilvl") for lvl in parent.iter(W_LVL)
+                if lvl.find(W_NUM_FMT) is not None and lvl.find(W_NUM_FMT).get(W_VAL) == "bullet"}
+
+    abstract = {a.get(W_ABSTRACT_NUM_ID): bullets(a) for a in root.iter(W_ABSTRACT_NUM)}
+    levels = set()
+    for num in root.iter(W_NUM):
+        abstract_id = num.find(W_ABSTRACT_NUM_ID)
+        fmt = set(abstract.get(abstract_id.get(W_VAL) if abstract_id is not None else None, ()))
+        # Переопределение уровня в самом w:num важнее абстрактного списка
+        for override in num.findall(W_LVL_OVERRIDE):
+            ilvl = override.get(W + "ilvl")
+            lvl = override.find(W_LVL)
+            if lvl is not None and lvl.find(W_NUM_FMT) is not None:
+                fmt.discard(ilvl)
+                if lvl.find(W_NUM_FMT).get(W_VAL) == "bullet":
+                    fmt.add(ilvl)
+        levels.update((num.get(W_NUM_ID), ilvl) for ilvl in fmt)
+    return levels
+
+
+def _collect_text(el, parts):
+    for child in el:
+        tag = child.tag
+        if tag == W_T:
+            parts.append(child.text or "")
+        elif tag == W_TAB:
+            parts.append("\t")
+        elif tag in (W_BR, W_CR):
+            parts.append("\n")
+        elif tag not in (W_PPR, W_RPR, MC_FALLBACK):
+            _collect_text(child, parts)
+    return parts
+
+
+def paragraph_text(p):
+    return "".join(_collect_text(p, []))
+
+
+def _paragraph_item(p, styles, bullets=()):
+    text = paragraph_text(p)
+    heading, level = False, clause_level(text)
+    ppr = p.find(W_PPR)
+    if ppr is not None:
+        p_style = ppr.find(W_PSTYLE)
+        if p_style is not None:
+            heading = styles.get(p_style.get(W_VAL), "").lower().startswith(HEADING_STYLES)
+        num_pr = ppr.find(W_NUMPR)
+        if level is None and num_pr is not None:
+            ilvl = num_pr.find(W_ILVL)
+            ilvl = ilvl.get(W_VAL, "0") if ilvl is not None else "0"
+            num_id = num_pr.find(W_NUM_ID)
+            if (num_id.get(W_VAL) if num_id is not None else None, ilvl) not in bullets:
+                level = int(ilvl) + 1
+    return {"text": text, "level": level, "heading": heading, "table": False}
+
+
+def _row_item(tr):
+    cells = ["\n".join(paragraph_text(p) for p in tc.iter(W_P)).strip() for tc in tr.findall(W_TC)]
+    return {"text": " ".join(cells), "level": None, "heading": False, "table": True}
+
+
+def iter_docx_items(file):
+    # Элементы в формате segmenter: {"text", "level", "heading", "table"}; пустые абзацы пропускаются
+    with zipfile.ZipFile(file) as zf:
+        styles = _style_names(zf)
+        bullets = _bullet_levels(zf)
+        with zf.open("word/document.xml") as xml:
+            body, tables = None, []
+            p_depth = 0
+            for event, el in ET.iterparse(xml, events=("start", "end")):
+                tag = el.tag
+                if event == "start":
+                    if tag == W_BODY:
+                        body = el
+                    elif tag == W_TBL:
+                        tables.append(el)
+                    elif tag == W_P:
+                        p_depth += 1
+                    continue
+                if tag == W_P:
+                    p_depth -= 1
+                    if tables or p_depth:
+                        continue
+                    item = _paragraph_item(el, styles, bullets)
+                    body.clear()
+                    if item["text"].strip():
+                        yield item
+                elif tag == W_TR and len(tables) == 1:
+                    item = _row_item(el)
+                    el.clear()
+                    if el in tables[0]:
+                        tables[0].remove(el)
+                    yield item
+                elif tag == W_TBL:
+                    tables.pop()
+                    if not tables:
+                        body.clear()
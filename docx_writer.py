@@ -0,0 +1,54 @@
+import re
+from xml.sax.saxutils import escape
+
+from docx.oxml import parse_xml
+from docx.oxml.ns import nsdecls
+
+# --- БЫСТРАЯ ЗАПИСЬ ТЕЛА ОТЧЕТА ---
+# Абзацы собираются строками OOXML за один проход и вставляются в документ
+# одним разбором XML - без создания объектов python-docx на каждый абзац/run.
+# Разметка совпадает с тем, что дают add_paragraph/add_run/bold/highlight_color.
+
+# Символы, запрещенные в XML (иногда приходят из ответа модели)
+BAD_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+# Как в python-docx: \t -> <w:tab/>, \n и \r -> <w:br/>
+SPECIAL_CHARS = re.compile(r"(\t|\n|\r)")
+
+ALIGN = {"center": "center", "justify": "both"}
+
+
+def run_xml(text, bold=False, highlight=None):
+    rpr = ""
+    if bold or highlight:
+        rpr = "<w:rPr>" + ("<w:b/>" if bold else "") + (f'<w:highlight w:val="{highlight}"/>' if highlight else "") + "</w:rPr>"
+    parts = []
+    for piece in SPECIAL_CHARS.split(BAD_XML_CHARS.sub("", text)):
+        if piece == "\t":
+            parts.append("<w:tab/>")
+        elif piece in ("\n", "\r"):
+            parts.append("<w:br/>")
+        elif piece:
+            space = ' xml:space="preserve"' if piece != piece.strip() else ""
+            parts.append(f"<w:t{space}>{escape(piece)}</w:t>")
+    return f"<w:r>{rpr}{''.join(parts)}</w:r>"
+
+
+def paragraph_xml(runs="", align=None):
+    ppr = f'<w:pPr><w:jc w:val="{ALIGN[align]}"/></w:pPr>' if align else ""
+    return f"<w:p>{ppr}{runs}</w:p>"
+
+
+def page_break_xml():
+    return '<w:p><w:r><w:br w:type="page"/></w:r></w:p>'
+
+
+def append_body_xml(doc, fragments):
+    # Вставляем все абзацы перед sectPr (свойства раздела должны остаться последними)
+    container = parse_xml(f"<w:body {nsdecls('w')}>{''.join(fragments)}</w:body>")
+    body = doc.element.body
+    sect_pr = body.sectPr
+    for el in list(container):
+        if sect_pr is not None:
+            sect_pr.addprevious(el)
+        else:
+            body.append(el)
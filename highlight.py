@@ -0,0 +1,77 @@
+import copy
+import re
+from functools import lru_cache
+
+from docx.enum.text import WD_COLOR_INDEX
+from docx.oxml.ns import qn
+from docx.text.run import Run
+
+# --- ПОДСВЕТКА КЛЮЧЕВЫХ СЛОВ ---
+# Все слова компилируются в одно регулярное выражение, каждый run просматривается
+# один раз. Подсвечивается только найденное слово (run разрезается на части),
+# обходятся абзацы, таблицы, колонтитулы.
+
+DEFAULT_KEYWORDS = ["Акт", "Фотоотчет", "Ведомость", "Скриншот", "Смета", "Резюме", "USB", "Флеш-накопитель"]
+
+# Run с такими элементами можно резать на части без потери содержимого
+PLAIN_RUN_TAGS = {qn("w:rPr"), qn("w:t"), qn("w:tab"), qn("w:br"), qn("w:cr")}
+
+
+class Highlighter:
+    def __init__(self, keywords):
+        words = sorted({w.strip() for w in keywords if w.strip()}, key=len, reverse=True)
+        # Слово с начала: "Акт" находит "Акт", "Акты", "Актом", но не "Контракт"
+        self.pattern = re.compile(
+            r"(?<!\w)(?:" + "|".join(map(re.escape, words)) + r")\w*", re.IGNORECASE
+        ) if words else None
+
+    def segments(self, text):
+        # [(кусок, подсвечен)] в исходном порядке
+        if not self.pattern or not text:
+            return [(text, False)]
+        out, pos = [], 0
+        for m in self.pattern.finditer(text):
+            if m.start() > pos:
+                out.append((text[pos:m.start()], False))
+            out.append((m.group(0), True))
+            pos = m.end()
+        if pos < len(text):
+            out.append((text[pos:], False))
+        return out or [(text, False)]
+
+    def highlight_run(self, r):
+        run = Run(r, None)
+        parts = self.segments(run.text)
+        if not any(hit for _, hit in parts):
+            return
+        if len(parts) == 1 or any(child.tag not in PLAIN_RUN_TAGS for child in r):
+            # Целиком совпавший run или run с картинкой/полем - подсвечиваем весь
+            run.font.highlight_color = WD_COLOR_INDEX.YELLOW
+            return
+        for text, hit in parts:
+            new_r = copy.deepcopy(r)
+            piece = Run(new_r, None)
+            piece.text = text
+            if hit:
+                piece.font.highlight_color = WD_COLOR_INDEX.YELLOW
+            r.addprevious(new_r)
+        r.getparent().remove(r)
+
+    def apply(self, doc):
+        if not self.pattern:
+            return
+        parts = [doc.element.body]
+        for section in doc.sections:
+            for hf in (section.header, section.footer, section.first_page_header,
+                       section.first_page_footer, section.even_page_header, section.even_page_footer):
+                if not hf.is_linked_to_previous:
+                    parts.append(hf._element)
+        for part in parts:
+            for r in list(part.iter(qn("w:r"))):
+                self.highlight_run(r)
+
+
+@lru_cache(maxsize=16)
+def get_highlighter(keywords):
+    # keywords - кортеж, чтобы один набор слов компилировался один раз
+    return Highlighter(keywords)
@@ -0,0 +1,243 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from llm import CachedClient, run_blocks
+from metrics import MeteredClient, Metrics
+from report import PROMPT_VERSION, create_final_report, smart_generate_step_strict
+
+# --- ФОНОВЫЕ ЗАДАНИЯ ПОШАГОВОЙ СБОРКИ ---
+# Задание живет в папке jobs/<id>/:
+#   job.json    - статус, число блоков, ошибка
+#   input.json  - блоки ТЗ, требования, реквизиты, слова подсветки
+#   blocks/N.txt - готовый блок N (контрольная точка)
+#   result.docx - итоговый отчет (если реквизиты t_info не заданы - только блоки)
+#   metrics.json - замеры времени и токенов по этапам и запросам
+# Генерация идет в фоновом потоке и не зависит от перезапусков Streamlit.
+# Прерванное задание продолжается с первого неготового блока.
+# У каждого блока есть отпечаток (текст + требования + версия промпта). Новое
+# задание того же документа берет из прошлого блоки с совпавшими отпечатками,
+# и заново генерируются только новые или измененные пункты.
+# Завершенные задания старше keep_days удаляются целиком; сверх max_kept удаляются
+# самые старые, кроме последних заданий документов (из них берутся готовые блоки).
+
+log = logging.getLogger(__name__)
+
+
+def _write_atomic(path, data):
+    tmp = path.with_name(path.name + ".tmp")
+    if isinstance(data, bytes):
+        tmp.write_bytes(data)
+    else:
+        tmp.write_text(data, encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def block_fingerprint(step, requirements):
+    # Пробелы и переносы не считаются изменением
+    norm = lambda text: " ".join((text or "").split())
+    raw = f"{PROMPT_VERSION}\x00{norm(requirements)}\x00{norm(step)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class JobManager:
+    def __init__(self, root, client, cache=None, max_jobs=2, block_workers=4, keep_days=7, max_kept=50):
+        # client - без кэша: замеры ставятся между кэшем и клиентом, чтобы считать только настоящие запросы
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.client = client
+        self.cache = cache
+        self.metrics = {}
+        self.block_workers = block_workers
+        self.pool = ThreadPoolExecutor(max_workers=max_jobs)
+        self.lock = threading.Lock()
+        self.running = set()
+        self.keep_days = keep_days
+        self.max_kept = max_kept
+        self.cleanup()
+        # Задания, оборванные остановкой сервера, продолжаем сразу
+        for job in self.list():
+            if job["status"] in ("queued", "running"):
+                self.resume(job["id"])
+
+    def _dir(self, job_id):
+        return self.root / job_id
+
+    def _meta(self, job_id):
+        return json.loads((self._dir(job_id) / "job.json").read_text(encoding="utf-8"))
+
+    def _set_meta(self, job_id, **fields):
+        meta = self._meta(job_id)
+        meta.update(fields)
+        _write_atomic(self._dir(job_id) / "job.json", json.dumps(meta, ensure_ascii=False))
+
+    def _docs(self):
+        path = self.root / "_docs.json"
+        return json.loads(path.read_text(encoding="utf-8")) if path.exists() else {}
+
+    def _reusable_blocks(self, doc_key):
+        # отпечаток -> текст блока из последнего задания этого документа
+        prev_id = self._docs().get(doc_key)
+        prev_dir = self._dir(prev_id) if prev_id else None
+        if not prev_dir or not (prev_dir / "input.json").exists():
+            return {}
+        prev = json.loads((prev_dir / "input.json").read_text(encoding="utf-8"))
+        blocks = {}
+        for i, fp in enumerate(prev.get("fingerprints", [])):
+            path = prev_dir / "blocks" / f"{i}.txt"
+            if path.exists():
+                blocks[fp] = path.read_text(encoding="utf-8")
+        return blocks
+
+    def _same_running(self, doc_key, fingerprints, t_info, keywords):
+        # Задание этого документа с теми же входными данными уже идет - второе не нужно
+        prev_id = self._docs().get(doc_key)
+        if prev_id not in self.running:
+            return None
+        prev = json.loads((self._dir(prev_id) / "input.json").read_text(encoding="utf-8"))
+        same = (prev.get("fingerprints"), prev.get("t_info"), prev.get("keywords")) == (fingerprints, t_info, keywords)
+        return prev_id if same else None
+
+    def create(self, steps, requirements, t_info, keywords=None, title="", doc_key=None, metrics=None):
+        # metrics - куда еще писать замеры (например, панель сессии)
+        self.cleanup()
+        fingerprints = [block_fingerprint(step, requirements) for step in steps]
+        running_id = self._same_running(doc_key, fingerprints, t_info, keywords) if doc_key else None
+        if running_id:
+            log.info("job %s: same input is already running", running_id)
+            return running_id
+        job_id = uuid.uuid4().hex[:12]
+        job_dir = self._dir(job_id)
+        (job_dir / "blocks").mkdir(parents=True)
+        reuse = self._reusable_blocks(doc_key) if doc_key else {}
+        reused = 0
+        for i, fp in enumerate(fingerprints):
+            if fp in reuse:
+                _write_atomic(job_dir / "blocks" / f"{i}.txt", reuse[fp])
+                reused += 1
+        _write_atomic(job_dir / "input.json", json.dumps({
+            "steps": steps, "requirements": requirements, "t_info": t_info, "keywords": keywords,
+            "fingerprints": fingerprints,
+        }, ensure_ascii=False))
+        _write_atomic(job_dir / "job.json", json.dumps({
+            "id": job_id, "title": title, "status": "queued", "total": len(steps), "reused": reused,
+            "created": time.time(), "error": None,
+        }, ensure_ascii=False))
+        if doc_key:
+            with self.lock:
+                docs = self._docs()
+                docs[doc_key] = job_id
+                _write_atomic(self.root / "_docs.json", json.dumps(docs, ensure_ascii=False))
+        log.info("job %s: %d blocks, reused %d", job_id, len(steps), reused)
+        if metrics is not None:
+            self.metrics[job_id] = metrics
+        self._start(job_id)
+        return job_id
+
+    def _start(self, job_id):
+        with self.lock:
+            if job_id in self.running:
+                return
+            self.running.add(job_id)
+        self.pool.submit(self._run, job_id)
+
+    def _run(self, job_id):
+        job_dir = self._dir(job_id)
+        metrics = Metrics(parent=self.metrics.get(job_id))
+        client = MeteredClient(self.client, metrics)
+        if self.cache is not None:
+            client = CachedClient(client, self.cache)
+        try:
+            inp = json.loads((job_dir / "input.json").read_text(encoding="utf-8"))
+            steps = inp["steps"]
+            todo = [i for i in range(len(steps)) if not (job_dir / "blocks" / f"{i}.txt").exists()]
+            self._set_meta(job_id, status="running", error=None)
+
+            def work(i):
+                part = smart_generate_step_strict(client, steps[i], inp["requirements"], metrics=metrics)
+                _write_atomic(job_dir / "blocks" / f"{i}.txt", part)
+                return part
+
+            with metrics.span("blocks", count=len(todo)):
+                run_blocks(work, todo, self.block_workers)
+            if inp["t_info"] is not None:
+                with metrics.span("create_final_report"):
+                    doc = create_final_report(inp["t_info"], self.text(job_id), inp["requirements"], inp["keywords"])
+                with metrics.span("doc.save"):
+                    doc.save(job_dir / "result.docx.tmp")
+                os.replace(job_dir / "result.docx.tmp", job_dir / "result.docx")
+            self._set_meta(job_id, status="done")
+        except Exception as e:
+            log.exception("job %s failed", job_id)
+            self._set_meta(job_id, status="failed", error=str(e))
+        finally:
+            _write_atomic(job_dir / "metrics.json", metrics.to_json())
+            with self.lock:
+                self.running.discard(job_id)
+                # Замеры сессии больше не держим: иначе менеджер копит их все до остановки сервера
+                self.metrics.pop(job_id, None)
+
+    def text(self, job_id):
+        # Все блоки задания по порядку
+        job_dir = self._dir(job_id)
+        total = self._meta(job_id)["total"]
+        return "\n\n".join((job_dir / "blocks" / f"{i}.txt").read_text(encoding="utf-8") for i in range(total))
+
+    def wait(self, job_id, poll=0.2):
+        # Ждем конца задания; ошибку задания поднимаем здесь
+        while True:
+            job = self.status(job_id)
+            if not job["active"] and job["status"] in ("done", "failed"):
+                break
+            time.sleep(poll)
+        if job["status"] == "failed":
+            raise RuntimeError(f"Задание {job_id}: {job['error']}")
+        return job
+
+    def resume(self, job_id):
+        if self._meta(job_id)["status"] != "done":
+            self._start(job_id)
+
+    def status(self, job_id):
+        try:
+            meta = self._meta(job_id)
+            meta["done"] = sum(1 for p in (self._dir(job_id) / "blocks").iterdir() if p.suffix == ".txt")
+        except FileNotFoundError:
+            # Нет такого задания или его только что удалила очистка
+            return None
+        meta["active"] = job_id in self.running
+        return meta
+
+    def result(self, job_id):
+        # Байты result.docx; app.py вызывает это только по нажатию кнопки скачивания
+        path = self._dir(job_id) / "result.docx"
+        return path.read_bytes() if path.exists() else b""
+
+    def cleanup(self):
+        # Папки заданий (ТЗ, блоки, отчеты) иначе копятся на диске без предела
+        cutoff = time.time() - self.keep_days * 24 * 3600
+        latest = set(self._docs().values())
+        finished = [j for j in reversed(self.list()) if not j["active"] and j["status"] in ("done", "failed")]
+        kept = 0
+        for job in finished:
+            if job["created"] >= cutoff and (job["id"] in latest or kept < self.max_kept):
+                kept += 1
+                continue
+            log.info("job %s: removed by retention", job["id"])
+            shutil.rmtree(self._dir(job["id"]), ignore_errors=True)
+        with self.lock:
+            docs = self._docs()
+            alive = {key: job_id for key, job_id in docs.items() if (self._dir(job_id) / "job.json").exists()}
+            if alive != docs:
+                _write_atomic(self.root / "_docs.json", json.dumps(alive, ensure_ascii=False))
+
+    def list(self):
+        jobs = [self.status(p.name) for p in self.root.iterdir() if (p / "job.json").exists()]
+        return sorted([j for j in jobs if j], key=lambda j: j["created"])
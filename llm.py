@@ -0,0 +1,430 @@
+import hashlib
+import json
+import logging
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from types import SimpleNamespace
+
+import openai
+from openai import OpenAI
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+try:
+    import httpx
+except ImportError:  # новые версии openai работают без httpx - тогда пул по умолчанию
+    httpx = None
+
+log = logging.getLogger(__name__)
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_HEADERS = {
+    "HTTP-Referer": "https://report-generator.streamlit.app",  # Твой адрес
+    "X-Title": "Report Generator",
+}
+
+# --- ОБЕРТКИ НАД КЛИЕНТОМ OPENAI ---
+# Каждая обертка повторяет интерфейс client.chat.completions.create(...),
+# поэтому их можно вкладывать друг в друга, не трогая места вызова.
+
+
+# Служебные параметры оберток, настоящему клиенту они не передаются
+WRAPPER_KWARGS = ("cache", "stage", "on_attempt")
+
+
+class ClientWrapper:
+    def __init__(self, inner):
+        self.inner = inner
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, **kwargs):
+        if not isinstance(self.inner, ClientWrapper):
+            for key in WRAPPER_KWARGS:
+                kwargs.pop(key, None)
+        return self.inner.chat.completions.create(**kwargs)
+
+
+class RateLimiter:
+    # Не больше rpm запросов за скользящую минуту (0 - без ограничения)
+    def __init__(self, rpm):
+        self.rpm = rpm
+        self.lock = threading.Lock()
+        self.calls = deque()
+
+    def acquire(self):
+        if not self.rpm:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                while self.calls and now - self.calls[0] >= 60:
+                    self.calls.popleft()
+                if len(self.calls) < self.rpm:
+                    self.calls.append(now)
+                    return
+                delay = 60 - (now - self.calls[0])
+            time.sleep(delay)
+
+
+class HeldStream:
+    # Поток ответа держит место в max_in_flight, пока его не дочитают или не закроют:
+    # create(stream=True) возвращается уже по заголовкам, а текст идет потом
+    def __init__(self, stream, release):
+        self.stream = stream
+        self.release = release
+        self.lock = threading.Lock()
+
+    def __iter__(self):
+        try:
+            yield from self.stream
+        finally:
+            self.close()
+
+    def close(self):
+        with self.lock:
+            release, self.release = self.release, None
+        if release:
+            release()
+            close = getattr(self.stream, "close", None)
+            if close: close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __del__(self):
+        # Брошенный непрочитанным поток не должен занимать место навсегда
+        self.close()
+
+
+class RateLimitedClient(ClientWrapper):
+    # rpm - запросов в минуту, max_in_flight - сколько запросов одновременно (None - без ограничения).
+    # Потоковый запрос занимает место до конца чтения потока
+    def __init__(self, inner, rpm, max_in_flight=None):
+        super().__init__(inner)
+        self.limiter = RateLimiter(rpm)
+        self.in_flight = threading.BoundedSemaphore(max_in_flight) if max_in_flight else None
+
+    def create(self, **kwargs):
+        self.limiter.acquire()
+        if self.in_flight is None:
+            return super().create(**kwargs)
+        self.in_flight.acquire()
+        try:
+            res = super().create(**kwargs)
+        except BaseException:
+            self.in_flight.release()
+            raise
+        if kwargs.get("stream"):
+            return HeldStream(res, self.in_flight.release)
+        self.in_flight.release()
+        return res
+
+
+# --- ТАЙМАУТЫ, ПОВТОРЫ, ДУБЛИРУЮЩИЕ ЗАПРОСЫ ---
+
+# Таймаут (секунды) по этапу: вызовы передают stage="..." в create(...)
+STAGE_TIMEOUTS = {
+    "requisites": 60, "requirements": 120, "rewrite": 600,
+    "draft": 120, "verify": 60, "fix": 120,
+}
+DEFAULT_TIMEOUT = 120
+RETRY_STATUSES = {408, 409, 429}
+
+
+def is_retryable(e):
+    if isinstance(e, (openai.APIConnectionError, openai.APITimeoutError, openai.RateLimitError)):
+        return True
+    if isinstance(e, openai.APIStatusError):
+        return e.status_code in RETRY_STATUSES or e.status_code >= 500
+    return False
+
+
+def retry_after(e):
+    # Сколько ждать по заголовку Retry-After, если сервер его прислал
+    response = getattr(e, "response", None)
+    try:
+        return float(response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class ResilientClient(ClientWrapper):
+    # retries - повторы на 429/5xx/обрыв связи с экспоненциальной паузой и случайным разбросом.
+    # hedge=True - если ответа нет дольше p95 задержки этого этапа, отправляем второй
+    # такой же запрос и берем тот ответ, что придет раньше.
+    # on_attempt(seconds, usage=None, error=None, duplicate=False) в create(...) получает
+    # каждую попытку, включая повторы и дубли (для замеров; для потока - только ошибки).
+    def __init__(self, inner, timeouts=None, retries=4, backoff=1.0, backoff_max=30.0,
+                 hedge=False, hedge_default=30.0, hedge_min_samples=20):
+        super().__init__(inner)
+        self.timeouts = {**STAGE_TIMEOUTS, **(timeouts or {})}
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.hedge = hedge
+        self.hedge_default = hedge_default
+        self.hedge_min_samples = hedge_min_samples
+        self.latencies = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=32) if hedge else None
+
+    def hedge_delay(self, stage):
+        with self.lock:
+            samples = sorted(self.latencies.get(stage, ()))
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_default
+        return samples[int(0.95 * (len(samples) - 1))]
+
+    def _record(self, stage, seconds):
+        with self.lock:
+            self.latencies.setdefault(stage, deque(maxlen=200)).append(seconds)
+
+    def _call(self, stage, kwargs, on_attempt=None, duplicate=False):
+        for attempt in range(self.retries + 1):
+            start = time.monotonic()
+            try:
+                res = super().create(**kwargs)
+            except Exception as e:
+                if on_attempt:
+                    on_attempt(time.monotonic() - start, error=type(e).__name__, duplicate=duplicate)
+                if attempt >= self.retries or not is_retryable(e):
+                    raise
+                delay = retry_after(e) or random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+                log.warning("LLM %s: %s, повтор %d через %.1f c", stage, type(e).__name__, attempt + 1, delay)
+                time.sleep(delay)
+                continue
+            if not kwargs.get("stream"):
+                self._record(stage, time.monotonic() - start)
+                if on_attempt:
+                    on_attempt(time.monotonic() - start, usage=getattr(res, "usage", None), duplicate=duplicate)
+            return res
+
+    def create(self, **kwargs):
+        stage = kwargs.pop("stage", None) or "default"
+        on_attempt = kwargs.pop("on_attempt", None)
+        kwargs.setdefault("timeout", self.timeouts.get(stage, DEFAULT_TIMEOUT))
+        if not self.hedge or kwargs.get("stream"):
+            return self._call(stage, kwargs, on_attempt)
+        first = self.pool.submit(self._call, stage, kwargs, on_attempt)
+        done, _ = wait([first], timeout=self.hedge_delay(stage))
+        if done:
+            return first.result()
+        log.info("LLM %s: нет ответа дольше %.1f c, дублируем запрос", stage, self.hedge_delay(stage))
+        pending = {first, self.pool.submit(self._call, stage, kwargs, on_attempt, True)}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                if fut.exception() is None:
+                    return fut.result()
+                error = fut.exception()
+        raise error
+
+
+def make_openrouter_client(api_key, rpm=60, max_in_flight=None, hedge=False, timeouts=None, pool_size=32,
+                           base_url=OPENROUTER_URL):
+    # Повторы делает ResilientClient, встроенные повторы openai отключены.
+    # Пул соединений держит keep-alive к OpenRouter для параллельных блоков
+    http_client = None
+    if httpx is not None:
+        http_client = openai.DefaultHttpxClient(
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size, keepalive_expiry=60),
+        )
+    base = OpenAI(
+        base_url=base_url, api_key=api_key, default_headers=OPENROUTER_HEADERS,
+        max_retries=0, http_client=http_client,
+    )
+    return ResilientClient(RateLimitedClient(base, rpm=rpm, max_in_flight=max_in_flight), timeouts=timeouts, hedge=hedge)
+
+
+# --- КЭШ ОТВЕТОВ НА ДИСКЕ ---
+
+def make_cache_key(kwargs):
+    # Ключ = модель + сообщения + все параметры запроса
+    raw = json.dumps(kwargs, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    # SQLite: запись живет ttl секунд, при превышении max_bytes
+    # удаляются давно не использованные записи (LRU)
+    def __init__(self, path, max_bytes=200 * 1024 * 1024, ttl=30 * 24 * 3600):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT, size INTEGER, created REAL, accessed REAL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+        self.conn.commit()
+
+    def get(self, key):
+        with self.lock:
+            now = time.time()
+            row = self.conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row and self.ttl and now - row[1] > self.ttl:
+                self.conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self.conn.commit()
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, value):
+        with self.lock:
+            now = time.time()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, len(value.encode("utf-8")), now, now)
+            )
+            self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        stale = []
+        for key, size in self.conn.execute("SELECT key, size FROM llm_cache ORDER BY accessed"):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self.conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM llm_cache")
+            self.conn.commit()
+
+    def stats(self):
+        with self.lock:
+            entries, size = self.conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "entries": entries, "bytes": size}
+
+
+def _completion_from_stream(first, text, finish_reason):
+    # Собираем из потока обычный ответ, чтобы положить его в кэш
+    return ChatCompletion.model_validate({
+        "id": first.id, "object": "chat.completion", "created": first.created, "model": first.model,
+        "choices": [{"index": 0, "finish_reason": finish_reason, "message": {"role": "assistant", "content": text}}],
+    })
+
+
+def _chunk_from_completion(res):
+    # Ответ из кэша отдаем потоковому вызову одним куском
+    return ChatCompletionChunk.model_validate({
+        "id": res.id, "object": "chat.completion.chunk", "created": res.created, "model": res.model,
+        "choices": [{"index": 0, "finish_reason": "stop",
+                     "delta": {"role": "assistant", "content": res.choices[0].message.content}}],
+    })
+
+
+class CachedClient(ClientWrapper):
+    # Передай cache=False в create(...), чтобы пропустить кэш для одного запроса.
+    # Кэшируются только законченные ответы (finish_reason "stop"): обрезанный
+    # по лимиту токенов ответ не должен возвращаться как полный
+    def __init__(self, inner, cache, enabled=True):
+        super().__init__(inner)
+        self.cache = cache
+        self.enabled = enabled
+
+    def create(self, **kwargs):
+        use_cache = kwargs.pop("cache", True)
+        if not (self.enabled and use_cache):
+            return super().create(**kwargs)
+        stream = kwargs.get("stream")
+        key = make_cache_key({k: v for k, v in kwargs.items() if k not in ("stream", "stream_options", "stage")})
+        hit = self.cache.get(key)
+        if hit is not None:
+            res = ChatCompletion.model_validate_json(hit)
+            return iter([_chunk_from_completion(res)]) if stream else res
+        if stream:
+            return self._stream_and_store(key, super().create(**kwargs))
+        res = super().create(**kwargs)
+        if res.choices and res.choices[0].finish_reason == "stop":
+            self.cache.put(key, res.model_dump_json())
+        return res
+
+    def _stream_and_store(self, key, chunks):
+        # В кэш попадает только поток, прочитанный до конца
+        first, parts, finish_reason = None, [], None
+        for chunk in chunks:
+            first = first or chunk
+            if chunk.choices:
+                finish_reason = chunk.choices[0].finish_reason or finish_reason
+                if chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+            yield chunk
+        if first is not None and finish_reason == "stop":
+            self.cache.put(key, _completion_from_stream(first, "".join(parts), finish_reason).model_dump_json())
+
+
+# --- ПОТОКОВЫЙ ВЫВОД ---
+
+def stream_text(client, on_delta=None, min_interval=0.2, **kwargs):
+    # on_delta(весь_текст_на_данный_момент) вызывается не чаще раза в min_interval секунд.
+    # include_usage: без него сервер может не прислать токены, и замеры останутся пустыми
+    kwargs.setdefault("stream_options", {"include_usage": True})
+    parts, last = [], 0.0
+    for chunk in client.chat.completions.create(stream=True, **kwargs):
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        parts.append(chunk.choices[0].delta.content)
+        now = time.monotonic()
+        if on_delta and now - last >= min_interval:
+            on_delta("".join(parts))
+            last = now
+    text = "".join(parts)
+    if on_delta:
+        on_delta(text)
+    return text
+
+
+def complete_text(client, stream=False, on_delta=None, **kwargs):
+    if stream:
+        return stream_text(client, on_delta=on_delta, **kwargs)
+    return client.chat.completions.create(**kwargs).choices[0].message.content
+
+
+# --- ПАРАЛЛЕЛЬНАЯ ОБРАБОТКА БЛОКОВ ---
+
+def run_blocks(func, blocks, max_workers=4, on_progress=None, on_tick=None, tick=0.3):
+    # Результаты в исходном порядке, прогресс - по мере готовности любого блока.
+    # on_progress/on_tick вызываются из текущего потока, поэтому в них можно трогать st.*;
+    # on_tick - раз в tick секунд, пока блоки считаются (для потокового вывода)
+    results = [None] * len(blocks)
+    if not blocks:
+        return results
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        futures = {pool.submit(func, block): i for i, block in enumerate(blocks)}
+        pending, done_count = set(futures), 0
+        try:
+            while pending:
+                finished, pending = wait(pending, timeout=tick if on_tick else None, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    results[futures[fut]] = fut.result()
+                    done_count += 1
+                    if on_progress:
+                        on_progress(done_count, len(blocks))
+                if on_tick and pending:
+                    on_tick()
+        except BaseException:
+            for fut in futures:
+                fut.cancel()
+            raise
+    return results
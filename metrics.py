@@ -0,0 +1,134 @@
+import csv
+import io
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+from llm import ClientWrapper
+
+# --- ЗАМЕРЫ ВРЕМЕНИ И ТОКЕНОВ ---
+# Каждая запись: kind ("span" - этап, "llm" - запрос к модели), name (этап), seconds
+# и произвольные поля. Итог по блоку ТЗ - span с name "block" и полями check, fixed.
+# Повторы и дубли запросов (hedge) - отдельные записи "llm" с error / duplicate.
+# Экспорт в JSON/CSV для поиска медленных этапов и дорогих блоков.
+
+
+class Metrics:
+    def __init__(self, parent=None):
+        # parent получает копию каждой записи (замеры задания -> панель сессии)
+        self.lock = threading.Lock()
+        self.records = []
+        self.parent = parent
+
+    def add(self, kind, name, seconds, **fields):
+        record = {"kind": kind, "name": name, "seconds": round(seconds, 4), "time": time.time(), **fields}
+        with self.lock:
+            self.records.append(record)
+        if self.parent is not None:
+            self.parent.add(kind, name, seconds, **fields)
+
+    @contextmanager
+    def span(self, name, **fields):
+        # В with ... as extra можно дописать поля по ходу этапа
+        start = time.monotonic()
+        try:
+            yield fields
+        finally:
+            self.add("span", name, time.monotonic() - start, **fields)
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+    def summary(self):
+        rows = {}
+        with self.lock:
+            records = list(self.records)
+        for r in records:
+            row = rows.setdefault((r["kind"], r["name"]), {
+                "kind": r["kind"], "name": r["name"], "count": 0, "seconds": 0.0, "max_seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "fixes": 0, "errors": 0, "duplicates": 0,
+            })
+            row["count"] += 1
+            row["seconds"] = round(row["seconds"] + r["seconds"], 4)
+            row["max_seconds"] = max(row["max_seconds"], r["seconds"])
+            row["prompt_tokens"] += r.get("prompt_tokens") or 0
+            row["completion_tokens"] += r.get("completion_tokens") or 0
+            row["fixes"] += 1 if r.get("fixed") else 0
+            row["errors"] += 1 if r.get("error") else 0
+            row["duplicates"] += 1 if r.get("duplicate") else 0
+        return sorted(rows.values(), key=lambda row: -row["seconds"])
+
+    def to_json(self):
+        with self.lock:
+            return json.dumps(self.records, ensure_ascii=False, indent=2)
+
+    def to_csv(self):
+        with self.lock:
+            records = list(self.records)
+        fields = []
+        for r in records:
+            fields += [k for k in r if k not in fields]
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=fields)
+        writer.writeheader()
+        writer.writerows(records)
+        return buf.getvalue()
+
+
+@contextmanager
+def span(metrics, name, **fields):
+    # То же, что metrics.span, но metrics может быть None
+    if metrics is None:
+        yield fields
+        return
+    with metrics.span(name, **fields) as extra:
+        yield extra
+
+
+class MeteredClient(ClientWrapper):
+    # Время и токены каждого настоящего запроса (ответы из кэша сюда не доходят).
+    # Над ResilientClient пишется каждая попытка: повторы после ошибок и дубли hedge
+    def __init__(self, inner, metrics):
+        super().__init__(inner)
+        self.metrics = metrics
+
+    def create(self, **kwargs):
+        stage = kwargs.get("stage") or "llm"
+        model = kwargs.get("model")
+        attempts = []
+
+        def on_attempt(seconds, usage=None, error=None, duplicate=False):
+            attempts.append(seconds)
+            self._add(stage, model, seconds, usage, error=error, duplicate=duplicate)
+
+        start = time.monotonic()
+        try:
+            res = super().create(on_attempt=on_attempt, **kwargs)
+        except Exception as e:
+            if not attempts:
+                self._add(stage, model, time.monotonic() - start, None, error=type(e).__name__)
+            raise
+        if kwargs.get("stream"):
+            return self._metered_stream(stage, model, start, res)
+        if not attempts:
+            self._add(stage, model, time.monotonic() - start, getattr(res, "usage", None))
+        return res
+
+    def _metered_stream(self, stage, model, start, chunks):
+        usage = None
+        for chunk in chunks:
+            usage = getattr(chunk, "usage", None) or usage
+            yield chunk
+        self._add(stage, model, time.monotonic() - start, usage)
+
+    def _add(self, stage, model, seconds, usage, error=None, duplicate=False):
+        fields = {"error": error} if error else {}
+        if duplicate:
+            fields["duplicate"] = True
+        self.metrics.add(
+            "llm", stage, seconds, model=model,
+            prompt_tokens=getattr(usage, "prompt_tokens", None),
+            completion_tokens=getattr(usage, "completion_tokens", None), **fields,
+        )
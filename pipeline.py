@@ -0,0 +1,87 @@
+import io
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from metrics import span
+from report import create_final_report, extract_requirements, extract_requisites, rewrite_full_text
+from segmenter import segment_items, segment_text
+
+# --- ВСЕ ЭТАПЫ ОДНОЙ КНОПКОЙ ---
+# Этапы - граф зависимостей: каждый стартует, как только готовы его входы.
+#   requisites, requirements, segmentation, rewrite - сразу и параллельно
+#   blocks        <- requirements, segmentation (фоновое задание JobManager: контрольные
+#                    точки по блокам, неизмененные блоки берутся из прошлого задания)
+#   report        <- requisites, rewrite, requirements
+#   smart_report  <- requisites, blocks, requirements
+# Общее время - самая длинная цепочка, а не сумма этапов. Сколько запросов к ИИ
+# идет одновременно, ограничивает сам клиент (make_openrouter_client(max_in_flight=...)).
+
+log = logging.getLogger(__name__)
+
+
+def run_dag(tasks, max_workers=4, on_done=None):
+    # tasks: имя -> (функция, [зависимости]); функция получает результаты зависимостей
+    # именованными аргументами. on_done(имя, секунды) вызывается в вызывающем потоке
+    results, started, pending = {}, {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while len(results) < len(tasks):
+            for name, (func, deps) in tasks.items():
+                if name not in started and all(d in results for d in deps):
+                    started[name] = time.monotonic()
+                    pending[pool.submit(func, **{d: results[d] for d in deps})] = name
+            if not pending:
+                raise ValueError(f"Циклические или неизвестные зависимости: {sorted(set(tasks) - set(results))}")
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = pending.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception:
+                    for other in pending:
+                        other.cancel()
+                    raise
+                log.info("stage %s done in %.2fs", name, time.monotonic() - started[name])
+                if on_done: on_done(name, time.monotonic() - started[name])
+    return results
+
+
+def _docx_bytes(t_info, body, requirements, keywords, metrics):
+    with span(metrics, "create_final_report"):
+        doc = create_final_report(t_info, body, requirements, keywords)
+    with span(metrics, "doc.save"):
+        buf = io.BytesIO()
+        doc.save(buf)
+    return buf.getvalue()
+
+
+def _job_blocks(jobs, steps, requirements, keywords, doc_key, metrics):
+    # Реквизитов еще может не быть: задание собирает только блоки, отчет строит smart_report.
+    # Задание переживает перезапуск страницы; повторный запуск берет готовые блоки
+    job_id = jobs.create(steps, requirements, None, keywords, title="pipeline", doc_key=doc_key,
+                         metrics=metrics)
+    jobs.wait(job_id)
+    return jobs.text(job_id)
+
+
+def run_report_pipeline(client, jobs, contract_text, tz_text, tz_items=None, keywords=None, max_workers=4,
+                        metrics=None, on_done=None, doc_key=None):
+    def stage(name, func):
+        def timed(**kwargs):
+            with span(metrics, name):
+                return func(**kwargs)
+        return timed
+
+    tasks = {
+        "requisites": (stage("requisites", lambda: extract_requisites(client, contract_text)), []),
+        "requirements": (stage("requirements", lambda: extract_requirements(client, tz_text)), []),
+        "segmentation": (stage("segmentation", lambda: segment_items(tz_items) if tz_items else segment_text(tz_text)), []),
+        "rewrite": (stage("rewrite", lambda: rewrite_full_text(client, tz_text, items=tz_items, max_workers=max_workers)), []),
+        "blocks": (lambda requirements, segmentation: _job_blocks(
+            jobs, segmentation, requirements, keywords, doc_key, metrics), ["requirements", "segmentation"]),
+        "report": (lambda requisites, rewrite, requirements: _docx_bytes(
+            requisites, rewrite, requirements, keywords, metrics), ["requisites", "rewrite", "requirements"]),
+        "smart_report": (lambda requisites, blocks, requirements: _docx_bytes(
+            requisites, blocks, requirements, keywords, metrics), ["requisites", "blocks", "requirements"]),
+    }
+    return run_dag(tasks, max_workers=len(tasks), on_done=on_done)
@@ -0,0 +1,327 @@
+import json
+import logging
+import re
+
+from docx import Document
+from docx.shared import Pt
+from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+from docx_reader import iter_docx_items
+from docx_writer import append_body_xml, page_break_xml, paragraph_xml, run_xml
+from highlight import DEFAULT_KEYWORDS, get_highlighter
+from llm import complete_text, run_blocks
+from metrics import span
+from requisites import local_requisites
+from tokens import OUTPUT_RATIO, check_budget, chunk_for_budget, estimate_tokens, get_budget
+from verifier import local_check
+
+# Логика отчета без интерфейса: ее используют app.py (Streamlit) и batch.py (командная строка)
+
+log = logging.getLogger(__name__)
+
+GEMINI_MODEL = "anthropic/claude-3.5-sonnet"
+# Меняй при правке промптов smart_generate_step_strict: сохраненные блоки станут недействительны
+PROMPT_VERSION = "1"
+
+# --- 1. ФУНКЦИИ ПАРСИНГА (ТВОИ ОРИГИНАЛЬНЫЕ) ---
+
+def get_contract_start_text(file, limit=2000):
+    # Читаем по порядку и останавливаемся на пункте 2. или после limit символов
+    full_text, size = [], 0
+    for item in iter_docx_items(file):
+        txt = item["text"].strip()
+        if not item["table"] and re.match(r"^2\.", txt):
+            break
+        full_text.append(txt)
+        size += len(txt) + 1
+        if size >= limit:
+            break
+    return "\n".join(full_text)[:limit]
+
+def get_items_from_file(file):
+    # Абзацы и строки таблиц в порядке документа + стиль заголовка и уровень нумерации
+    return list(iter_docx_items(file))
+
+def get_text_from_file(file):
+    return "\n".join(item["text"] for item in iter_docx_items(file))
+
+def format_fio_short(fio_str):
+    if not fio_str: return "___________"
+    parts = fio_str.split()
+    if len(parts) >= 3:
+        return f"{parts[0]} {parts[1][0]}.{parts[2][0]}."
+    return fio_str
+
+def clean_markdown(text):
+    return text.replace('**', '').replace('###', '').replace('##', '').replace('|', '').strip()
+
+# --- 2. УМНАЯ ГЕНЕРАЦИЯ (ЛОГИКА ВНУТРИ) ---
+
+def smart_generate_step_strict(client, section_text, requirements_text, on_delta=None, metrics=None):
+    # В metrics пишется итог по блоку: время, решение локальной проверки, был ли fix
+    with span(metrics, "block", chars=len(section_text)) as extra:
+        return _generate_step(client, section_text, requirements_text, on_delta, extra)
+
+
+def _generate_step(client, section_text, requirements_text, on_delta, extra):
+    system_prompt = f"""Ты - юридический редактор. Перепиши пункты ТЗ в Отчет.
+    ПРАВИЛА:
+    1. ВРЕМЯ: У заголовком - настоящее, у текста - СТРОГО ПРОШЕДШЕЕ ('организовано', 'оказано', 'размещено').
+    2. ЗАПРЕТ: Слова 'должен', 'обязан', 'будет', 'необходимо' КАТЕГОРИЧЕСКИ ЗАПРЕЩЕНЫ.
+    3. ТОЧНОСТЬ: Перенеси ВСЕ цифры, площади, сроки и названия без изменений.
+    4. ПУНКТУАЦИЯ: Соблюдай правила русского языка. Не обрывай предложения.
+    ТРЕБОВАНИЯ К ДОКУМЕНТАМ: {requirements_text}"""
+
+    full_prompt = f"{system_prompt}\n\nТРАНСФОРМИРУЙ ЭТОТ КУСОК ТЗ В ОТЧЕТ:\n{section_text}"
+
+    # Шаг 1: Генерация (если передан on_delta - потоком)
+    draft = complete_text(
+      client, stream=on_delta is not None, on_delta=on_delta,
+      model=GEMINI_MODEL, stage="draft",
+      messages=[{"role": "user", "content": full_prompt}]
+    )
+
+    # Шаг 2: ЖЕСТКИЙ КОНТРОЛЬ
+    # Сначала локально: числа, названия, запрещенные слова. ИИ - только если есть сомнения
+    check = local_check(section_text, draft)
+    extra["check"] = check["decision"]
+    if check["decision"] == "ok":
+        return draft
+    if check["decision"] == "fail":
+        v_text = "\n".join(check["problems"] + check["doubts"])
+    else:
+        v_prompt = f"Сравни ТЗ и Отчет. Если есть ошибки, напиши их. Если всё ок, пиши 'ОШИБОК: 0'.\nТЗ: {section_text}\nОТЧЕТ: {draft}"
+        v_res = client.chat.completions.create(
+            model=GEMINI_MODEL, stage="verify",
+            messages=[{"role": "user", "content": v_prompt}]
+        )
+        v_text = v_res.choices[0].message.content
+    
+    # Шаг 3: Исправление (если инспектор нашел брак)
+    if "ОШИБОК: 0" not in v_text:
+        extra["fixed"] = True
+        fix_prompt = f"{system_prompt}\nИСПРАВЬ ОШИБКИ: {v_text}\nТЗ: {section_text}\nЧЕРНОВИК: {draft}"
+        return complete_text(
+            client, stream=on_delta is not None, on_delta=on_delta,
+            model=GEMINI_MODEL, stage="fix",
+            messages=[{"role": "user", "content": fix_prompt}]
+        )
+    return draft
+
+REWRITE_INSTRUCTION = """Роль и контекст:
+                    Ты — ассистент юриста по договорной работе. Перед тобой текст Технического Задания (ТЗ), который был написан в будущем времени как план работ. Сейчас его нужно превратить в черновик отчета о выполнении. Твоя задача — действовать как автомат по замене времени и удалению лишних слов, не меняя структуру и терминологию документа. Объём документа может быть очень большим (до 20 страниц) — это нормально, ты должен сохранить весь текст полностью, ничего не выбрасывая и не пересказывая.
+                    
+                    Инструкция (Что нужно сделать):
+                    Необходимо полностью переработать текст ТЗ в текст отчета, выполненного в прошедшем времени, со следующими важными исключениями.
+                    
+                    Правила обработки (Набор правил):
+                    
+                    Неприкосновенность заголовков (Важно!): Все заголовки пунктов и подпунктов ТЗ должны остаться в настоящем времени (как в оригинале). Их менять нельзя.
+                    
+                    Пример: Заголовок «Предоставление транспортных услуг...» должен остаться без изменений.
+                    
+                    Применяй это правило ко всем уровням заголовков.
+                    
+                    Основное время (Тело пунктов): Весь описательный текст, следующий за заголовком (внутри пункта), нужно переписать в прошедшее время.
+                    
+                    Пример: «Исполнитель организует доставку...» -> «Исполнитель организовал доставку...».
+                    
+                    Чистка текста (Удаление модального мусора): В отчете не должно быть слов, указывающих на долженствование или ограничения из ТЗ. Их нужно удалять или заменять, не искажая сути:
+                    
+                    Слова для удаления: должен, обязан, нужно, необходимо, следует.
+                    
+                    Пример: «Исполнитель обязан предоставить отчет» -> «Исполнитель предоставил отчет».
+                    
+                    Слова для удаления (если они не влияют на цифры): более, менее, не более, не менее, свыше (часто они просто указывают на план, в отчете важны конкретные цифры).
+                    
+                    Пример: «Поставлено не менее 10 ящиков» -> «Поставлено 10 ящиков» (если факт совпадает с минимумом; если поставлено больше, лучше сохранить факт: «Поставлено 12 ящиков»).
+                    
+                    Неизменность данных и объёма: Все, что не является глаголами или мусорными словами из п.3, должно остаться нетронутым:
+                    
+                    Сроки (числа), адреса, имена, названия организаций, специфические термины, номенклатурные номера — все остается как в оригинале ТЗ.
+                    
+                    Важно: ни в коем случае не сокращай текст, не убирай предложения, не пересказывай своими словами. Сохраняй исходный объём и все детали, даже если текст очень длинный. Просто заменяй времена и удаляй указанные слова.
+                    
+                    Работа с описаниями процессов: Длинные описания того, как надо делать, превращаются в описание того, как было сделано.
+                    
+                    Формат вывода:
+                    Выведи полностью переработанный текст. Начинай с первого заголовка документа. Не добавляй никаких вступлений, комментариев или пояснений в квадратных скобках. 
+                    Только чистый текст отчета."""
+
+def rewrite_full_text(client, tz_content, stream=False, on_delta=None, items=None, max_workers=4, on_warning=None):
+    # ТЗ режется по пунктам под бюджет токенов модели, куски идут параллельно
+    # и склеиваются по порядку. Короткое ТЗ уходит одним запросом, как раньше
+    budget = get_budget(GEMINI_MODEL)
+    chunks = chunk_for_budget(tz_content, GEMINI_MODEL, estimate_tokens(REWRITE_INSTRUCTION), items)
+    prompts = [f"{REWRITE_INSTRUCTION}\n\n{chunk}" for chunk in chunks]
+    # Проверка бюджета локальная: предупреждаем до отправки, в вызывающем потоке
+    for i, chunk in enumerate(chunks):
+        warning = check_budget(GEMINI_MODEL, prompts[i], int(estimate_tokens(chunk) * OUTPUT_RATIO))
+        if warning:
+            log.warning("rewrite chunk %d: %s", i, warning)
+            if on_warning: on_warning(warning)
+    live = {}
+
+    def work(i):
+        return complete_text(
+            client, stream=stream, on_delta=(lambda text: live.__setitem__(i, text)) if stream else None,
+            model=GEMINI_MODEL, max_tokens=budget["output"], stage="rewrite",
+            messages=[{"role": "user", "content": prompts[i]}]
+        )
+
+    def render():
+        if on_delta: on_delta("\n\n".join(text for _, text in sorted(dict(live).items())))
+
+    parts = run_blocks(work, list(range(len(chunks))), max_workers, on_tick=render if stream else None)
+    text = "\n\n".join(parts)
+    if on_delta: on_delta(text)
+    return text
+
+# Ключи реквизитов и подсказки для ИИ
+REQUISITE_FIELDS = {
+    "contract_no": "номер",
+    "contract_date": "дата в виде ДД.ММ.ГГГГ",
+    "ikz": "ИКЗ",
+    "project_name": "предмет контракта",
+    "customer": "Заказчик",
+    "customer_post": "должность заказчика",
+    "customer_fio": "ФИО заказчика",
+    "company": "Исполнитель",
+    "director_post": "должность руководителя исполнителя",
+    "director": "ФИО руководителя исполнителя",
+}
+
+def extract_requisites(client, text):
+    # Поля со строгим форматом берем локально, у ИИ спрашиваем только недостающие
+    found = local_requisites(text)
+    missing = [key for key in REQUISITE_FIELDS if key not in found]
+    if not missing:
+        return found
+    fields = ",\n".join(f"'{key}' ({REQUISITE_FIELDS[key]})" for key in missing)
+    res = client.chat.completions.create(
+        model=GEMINI_MODEL, stage="requisites",
+        messages=[{
+            "role": "user", 
+            "content": f"Извлеки данные СТРОГО в формате JSON с этими ключами:\n{fields}.\nТекст: {text}"
+        }],
+        response_format={ "type": "json_object" }
+    )
+    data = json.loads(res.choices[0].message.content)
+    return {**data, **found}
+
+def extract_requirements(client, tz_text):
+    res = client.chat.completions.create(
+        model=GEMINI_MODEL, stage="requirements",
+        messages=[{"role": "user", "content": f"Выпиши требования к документам: {tz_text}"}]
+    )
+    return res.choices[0].message.content
+
+# --- 3. СБОРКА ДОКУМЕНТА (ТВОЕ ОФОРМЛЕНИЕ) ---
+
+def build_title_page(t):
+    doc = Document()
+    
+    # Настройка узких полей (чтобы точно влезло)
+    sections = doc.sections
+    for section in sections:
+        section.top_margin = Pt(36)    # 1.27 см
+        section.bottom_margin = Pt(36)
+        section.left_margin = Pt(72)   # 2.54 см
+        section.right_margin = Pt(36)
+
+    style = doc.styles['Normal']
+    style.font.name = 'Times New Roman'
+    style.font.size = Pt(12)
+    
+    # Сбор данных [cite: 151]
+    contract_no = t.get('contract_no', '___')
+    contract_date = t.get('contract_date', '___')
+    ikz = t.get('ikz', '___________')
+
+    # Шапка 
+    p = doc.add_paragraph()
+    p.alignment = WD_ALIGN_PARAGRAPH.CENTER
+    p.add_run("Информационно-аналитический отчет об исполнении условий\n").bold = True
+    p.add_run(f"Контракта № {contract_no} от {contract_date} г.\n").bold = True
+    p.add_run(f"Идентификационный код закупки: {ikz}").bold = True
+
+    # Уменьшенный отступ перед ТОМ I
+    for _ in range(3): doc.add_paragraph() 
+    doc.add_paragraph("ТОМ I").alignment = WD_ALIGN_PARAGRAPH.CENTER
+
+    # Предмет, Заказчик, Исполнитель [cite: 3-8, 153-158]
+    for label, val in [
+        ("Наименование предмета КОНТРАКТА:", t.get('project_name')),
+        ("Заказчик:", t.get('customer')),
+        ("Исполнитель:", t.get('company'))
+    ]:
+        p_l = doc.add_paragraph()
+        p_l.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        p_l.add_run(f"\n{label}").bold = True
+        
+        p_v = doc.add_paragraph()
+        p_v.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        # Ограничиваем длину текста предмета, если он слишком длинный
+        p_v.add_run(str(val)).italic = True
+
+    # Динамический отступ перед подписями (уменьшен до 4)
+    for _ in range(4): doc.add_paragraph()
+    
+    # Таблица подписей [cite: 9, 159]
+    tab = doc.add_table(rows=2, cols=2)
+    tab.autofit = True
+
+    cust_post = str(t.get('customer_post', 'Заказчик')).capitalize()
+    exec_post = str(t.get('director_post', 'Исполнитель')).capitalize()
+    cust_fio = format_fio_short(t.get('customer_fio'))
+    exec_fio = format_fio_short(t.get('director'))
+
+    # Левая ячейка (Заказчик)
+    p1 = tab.rows[0].cells[0].paragraphs[0]
+    p1.add_run(f"Отчет принят Заказчиком\n{cust_post}\n\n___________ / {cust_fio}")
+    
+    # Правая ячейка (Исполнитель)
+    p2 = tab.rows[0].cells[1].paragraphs[0]
+    p2.add_run(f"Отчет передан Исполнителем\n{exec_post}\n\n___________ / {exec_fio}")
+
+    # М.П. (нижняя строка таблицы)
+    tab.rows[1].cells[0].text = "м.п."
+    tab.rows[1].cells[1].text = "м.п."
+
+    return doc
+    
+def apply_yellow_highlight(doc, keywords=None):
+    # None - слова по умолчанию, пустой список - подсветка выключена
+    get_highlighter(tuple(DEFAULT_KEYWORDS if keywords is None else keywords)).apply(doc)
+
+def create_final_report(t, report_body, req_body, keywords=None):
+    doc = build_title_page(t)
+    apply_yellow_highlight(doc, keywords)
+    hl = get_highlighter(tuple(DEFAULT_KEYWORDS if keywords is None else keywords))
+    
+    # Чтобы не было "Отчет об оказании услуг по услуг"
+    p_name = t.get('project_name', '')
+    if isinstance(p_name, dict): p_name = p_name.get('name', '')
+    p_name = str(p_name).strip() if p_name else "услугам"
+
+    # Тело отчета собираем сразу в OOXML, подсветка решается по ходу
+    def para(text, align, bold=False):
+        runs = "".join(run_xml(piece, bold, "yellow" if hit else None) for piece, hit in hl.segments(text))
+        return paragraph_xml(runs, align)
+
+    body = [page_break_xml(), para(f"Отчет об оказании услуг по {p_name}", "center", bold=True)]
+    
+    # Очищаем основной текст от дублей и пустых строк
+    lines = clean_markdown(report_body).split('\n')
+    for line in lines:
+        line = line.strip()
+        if not line: continue
+        body.append(para(line, "justify", bold=bool(re.match(r"^\d+\.", line))))
+        
+    if req_body:
+        body.append(page_break_xml())
+        body.append(para('ТРЕБОВАНИЯ К ПРЕДОСТАВЛЯЕМОЙ ДОКУМЕНТАЦИИ', "center", bold=True))
+        body.append(para(clean_markdown(req_body), "justify"))
+        
+    append_body_xml(doc, body)
+    return doc
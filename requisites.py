@@ -0,0 +1,141 @@
+import logging
+import re
+
+# --- ЛОКАЛЬНОЕ ИЗВЛЕЧЕНИЕ РЕКВИЗИТОВ ---
+# Поля со строгим форматом (ИКЗ, номер, дата, ФИО) ищутся регулярками в начале
+# контракта. Поле заполняется, только если найдено однозначно; остальное
+# спрашиваем у ИИ.
+
+log = logging.getLogger(__name__)
+
+# ИКЗ - ровно 36 цифр
+IKZ_RE = re.compile(r"(?<!\d)\d{36}(?!\d)")
+CONTRACT_NO_RE = re.compile(r"(?:контракт|договор)\w*\s*№\s*([\w][\w/.-]*[\w])", re.IGNORECASE)
+MONTHS = ("января", "февраля", "марта", "апреля", "мая", "июня",
+          "июля", "августа", "сентября", "октября", "ноября", "декабря")
+DATE_RE = re.compile(
+    r"(?<!\d)(\d{2}\.\d{2}\.\d{4})(?!\d)"
+    r"|«?\s*(\d{1,2})\s*»?\s+(" + "|".join(MONTHS) + r")\s+(\d{4})",
+    re.IGNORECASE,
+)
+# Фамилия Имя Отчество в любом падеже (отчество: -ич..., -вн..., -чн...)
+FIO_RE = re.compile(r"\b([А-ЯЁ][а-яё]+(?:-[А-ЯЁ][а-яё]+)?\s+[А-ЯЁ][а-яё]+\s+[А-ЯЁ][а-яё]+(?:ич|вн|чн)[а-яё]{0,2})\b")
+# "в лице директора Иванова Ивана Ивановича," - кто подписывает за сторону
+IN_PERSON_RE = re.compile(r"в\s+лице\s+([^,;]+)", re.IGNORECASE)
+PARTY_RE = re.compile(r"именуем\w*\s+(?:в\s+дальнейшем\s+)?[«\"]?(Заказчик|Исполнитель)", re.IGNORECASE)
+PARTY_FIO_KEYS = {"заказчик": "customer_fio", "исполнитель": "director"}
+# Границы описаний сторон: "..., с одной стороны, и ..." или просто ", и ООО ..."
+SIDE_RE = re.compile(r"с\s+(?:одной|другой)\s+стороны", re.IGNORECASE)
+AND_RE = re.compile(r",\s+и\s", re.IGNORECASE)
+PREAMBLE_END_RE = re.compile(r"заключили|о\s+нижеследующем", re.IGNORECASE)
+
+# Родительный падеж -> именительный: (окончание, замена); None - не угадать, ФИО не берем.
+# Несклоняемые фамилии (Шевченко, Черных) и женские на согласную остаются как есть
+GENITIVE_ENDINGS = {
+    "male": {
+        "surname": [("ского", "ский"), ("цкого", "цкий"), ("ого", None), ("его", None), ("а", ""), ("я", None)],
+        "name": [("ея", "ей"), ("ая", "ай"), ("ия", "ий"), ("ьи", "ья"), ("ы", "а"), ("а", "")],
+        "patronymic": [("ича", "ич")],
+    },
+    "female": {
+        "surname": [("овой", "ова"), ("евой", "ева"), ("ёвой", "ёва"), ("иной", "ина"), ("ыной", "ына"),
+                    ("ской", "ская"), ("цкой", "цкая"), ("ой", None), ("ей", None)],
+        "name": [("ии", "ия"), ("ьи", "ья"), ("ки", "ка"), ("ги", "га"), ("хи", "ха"), ("жи", "жа"),
+                 ("ши", "ша"), ("чи", "ча"), ("щи", "ща"), ("ы", "а")],
+        "patronymic": [("ны", "на")],
+    },
+}
+GENITIVE_NAMES = {"Павла": "Павел", "Льва": "Лев", "Любови": "Любовь"}
+INDECLINABLE = ("о", "е", "у", "ю", "ых", "их")
+
+
+def _unique(values):
+    values = set(values)
+    return values.pop() if len(values) == 1 else None
+
+
+def _date(text):
+    # Всегда ДД.ММ.ГГГГ - в этом же виде дату просим у ИИ и печатаем на титульнике
+    for m in DATE_RE.finditer(text):
+        if m.group(1):
+            return m.group(1)
+        return f"{int(m.group(2)):02d}.{MONTHS.index(m.group(3).lower()) + 1:02d}.{m.group(4)}"
+    return None
+
+
+def _decline(word, endings, gender, part):
+    if word in GENITIVE_NAMES and part == "name":
+        return GENITIVE_NAMES[word]
+    for ending, nominative in endings:
+        if word.endswith(ending):
+            return None if nominative is None else word[:-len(ending)] + nominative
+    if word.endswith(INDECLINABLE):
+        return word
+    # Женская фамилия на согласную не склоняется; прочее не узнали
+    return word if gender == "female" and part == "surname" and word[-1] not in "аяиы" else None
+
+
+def _nominative(fio):
+    # После "в лице" ФИО обычно в родительном падеже: "Иванова Ивана Ивановича".
+    # Род берем по отчеству; если окончание не распознано - None
+    surname, name, patronymic = fio.split()
+    if patronymic.endswith(("ич", "на")):
+        return fio
+    gender = "male" if patronymic.endswith("ича") else "female" if patronymic.endswith("ны") else None
+    if gender is None:
+        return None
+    endings = GENITIVE_ENDINGS[gender]
+    parts = [_decline(p, endings["surname"], gender, "surname") for p in surname.split("-")]
+    parts += [_decline(name, endings["name"], gender, "name"),
+              _decline(patronymic, endings["patronymic"], gender, "patronymic")]
+    if None in parts:
+        return None
+    return f"{'-'.join(parts[:-2])} {parts[-2]} {parts[-1]}"
+
+
+def _party_clauses(text):
+    # [(сторона, ее описание)]. "в лице" бывает и до, и после "именуемое «...»":
+    # описание тянется до "с одной/другой стороны" или до ", и" перед следующей стороной.
+    # Если границы между сторонами нет, текст между ними не относим ни к одной
+    mentions = list(PARTY_RE.finditer(text))
+    clauses, start = [], 0
+    for i, m in enumerate(mentions):
+        if i + 1 == len(mentions):
+            tail = text[m.end():]
+            stop = SIDE_RE.search(tail) or PREAMBLE_END_RE.search(tail)
+            end, next_start = m.end() + (stop.start() if stop else len(tail)), None
+        else:
+            gap = text[m.end():mentions[i + 1].start()]
+            cuts = [c.end() for c in SIDE_RE.finditer(gap)] or [c.start() for c in AND_RE.finditer(gap)]
+            if cuts:
+                end = next_start = m.end() + cuts[-1]
+            else:
+                end, next_start = m.end(), mentions[i + 1].start()
+        clauses.append((m.group(1).lower(), text[start:end]))
+        start = next_start
+    return clauses
+
+
+def local_requisites(text):
+    found = {}
+    ikz = _unique(IKZ_RE.findall(text))
+    if ikz:
+        found["ikz"] = ikz
+    contract_no = _unique(CONTRACT_NO_RE.findall(text))
+    if contract_no:
+        found["contract_no"] = contract_no
+    # Дата контракта - первая дата в шапке ("г. Москва «01» марта 2025 г.")
+    date = _date(text)
+    if date:
+        found["contract_date"] = date
+    # ФИО относим к стороне, только если оно стоит после "в лице" в ее описании;
+    # прочие ФИО в шапке не учитываем. Разные ФИО у одной стороны - спросим у ИИ
+    fios = {}
+    for party, clause in _party_clauses(text):
+        for person in IN_PERSON_RE.findall(clause):
+            fios.setdefault(PARTY_FIO_KEYS[party], set()).update(_nominative(f) for f in FIO_RE.findall(person))
+    for key, values in fios.items():
+        if len(values) == 1 and None not in values:
+            found[key] = values.pop()
+    log.info("requisites found locally: %s", ", ".join(sorted(found)) or "-")
+    return found
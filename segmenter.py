@@ -0,0 +1,92 @@
+import re
+
+# --- ЛОКАЛЬНАЯ РАЗБИВКА ТЗ НА БЛОКИ ---
+# Элемент ТЗ: {"text": ..., "level": уровень нумерации или None,
+#              "heading": стиль заголовка, "table": строка таблицы}
+# Новый блок начинается с пункта или заголовка, строки таблиц остаются
+# в пункте, к которому относятся.
+
+MAX_BLOCK_CHARS = 4000
+MIN_BLOCK_CHARS = 300
+
+# Номер пункта в начале строки: "1.", "2.1", "3.2.1." (даты вида 01.02.2025 не подходят)
+CLAUSE_RE = re.compile(r"^(\d{1,2}(?:\.\d{1,2})+\.?|\d{1,2}\.)(?=\s|[А-ЯЁA-Z])")
+SENTENCE_RE = re.compile(r"(?<=[.!?;])\s+")
+
+
+def clause_level(text):
+    m = CLAUSE_RE.match(text.strip())
+    if not m:
+        return None
+    return len(m.group(1).rstrip(".").split("."))
+
+
+def items_from_text(text):
+    # Для текста, вставленного вручную: структура только по номерам пунктов
+    return [
+        {"text": line.strip(), "level": clause_level(line), "heading": False, "table": False}
+        for line in text.split("\n") if line.strip()
+    ]
+
+
+def _split_long(text, max_chars):
+    # Слишком длинный пункт режем по строкам, затем по предложениям
+    if len(text) <= max_chars:
+        return [text]
+    pieces = []
+    for line in text.split("\n"):
+        if len(line) <= max_chars:
+            pieces.append(line)
+            continue
+        for sentence in SENTENCE_RE.split(line):
+            while len(sentence) > max_chars:
+                pieces.append(sentence[:max_chars])
+                sentence = sentence[max_chars:]
+            pieces.append(sentence)
+    parts, cur = [], ""
+    for piece in pieces:
+        if cur and len(cur) + 1 + len(piece) > max_chars:
+            parts.append(cur)
+            cur = piece
+        else:
+            cur = f"{cur}\n{piece}" if cur else piece
+    if cur:
+        parts.append(cur)
+    return parts
+
+
+def _pack(groups, max_chars, min_chars):
+    # Мелкие пункты склеиваем с соседними, но не больше max_chars
+    blocks, cur = [], ""
+    for group in groups:
+        for piece in _split_long(group, max_chars):
+            if not cur:
+                cur = piece
+            elif len(cur) < min_chars and len(cur) + 1 + len(piece) <= max_chars:
+                cur = f"{cur}\n{piece}"
+            else:
+                blocks.append(cur)
+                cur = piece
+    if cur:
+        if blocks and len(cur) < min_chars and len(blocks[-1]) + 1 + len(cur) <= max_chars:
+            blocks[-1] = f"{blocks[-1]}\n{cur}"
+        else:
+            blocks.append(cur)
+    return blocks
+
+
+def segment_items(items, max_chars=MAX_BLOCK_CHARS, min_chars=MIN_BLOCK_CHARS):
+    groups = []
+    for item in items:
+        text = item["text"].strip()
+        if not text:
+            continue
+        starts = not item.get("table") and (item.get("heading") or item.get("level") is not None)
+        if starts or not groups:
+            groups.append([])
+        groups[-1].append(text)
+    return _pack(["\n".join(g) for g in groups], max_chars, min_chars)
+
+
+def segment_text(text, max_chars=MAX_BLOCK_CHARS, min_chars=MIN_BLOCK_CHARS):
+    return segment_items(items_from_text(text), max_chars, min_chars)
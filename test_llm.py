@@ -0,0 +1,177 @@
+import threading
+import time
+
+import openai
+import pytest
+from openai.types.chat import ChatCompletion
+
+from bench import FakeLLMHandler, start_fake_llm
+from llm import CachedClient, LLMCache, RateLimitedClient, ResilientClient, make_openrouter_client, stream_text
+from metrics import MeteredClient, Metrics
+
+# ResilientClient против локального сервера, совместимого с OpenAI (тот же, что в bench.py).
+# Каждый запрос берет следующий шаг из script: (код ответа, заголовки, задержка);
+# когда шаги кончились - обычный ответ 200.
+
+
+class ScriptedHandler(FakeLLMHandler):
+    script = []
+    seen = []
+
+    def do_POST(self):
+        self.seen.append(time.monotonic())
+        step = self.script.pop(0) if self.script else (200, {}, 0)
+        status, headers, delay = step
+        time.sleep(delay)
+        if status == 200:
+            return super().do_POST()
+        self.rfile.read(int(self.headers["Content-Length"]))
+        data = b'{"error": {"message": "scripted"}}'
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+@pytest.fixture
+def stub():
+    server, url = start_fake_llm(0.0, handler=ScriptedHandler, script=[], seen=[])
+    yield server.RequestHandlerClass, url
+    server.shutdown()
+
+
+def client_for(url, **kwargs):
+    client = make_openrouter_client("test", rpm=0, base_url=url, **kwargs)
+    client.backoff = 0.01
+    return client
+
+
+def ask(client, **kwargs):
+    res = client.chat.completions.create(
+        model="test", stage="draft", messages=[{"role": "user", "content": "Сравни ТЗ и Отчет"}], **kwargs
+    )
+    return res.choices[0].message.content
+
+
+def test_retries_503_then_succeeds(stub):
+    handler, url = stub
+    handler.script.append((503, {}, 0))
+    assert ask(client_for(url)) == "ОШИБОК: 0"
+    assert len(handler.seen) == 2
+
+
+def test_400_is_not_retried(stub):
+    handler, url = stub
+    handler.script.append((400, {}, 0))
+    with pytest.raises(openai.BadRequestError):
+        ask(client_for(url))
+    assert len(handler.seen) == 1
+
+
+def test_retry_after_is_honoured(stub):
+    handler, url = stub
+    handler.script.append((429, {"Retry-After": "0.5"}, 0))
+    client = client_for(url)
+    client.backoff = 0
+    assert ask(client) == "ОШИБОК: 0"
+    assert len(handler.seen) == 2
+    assert handler.seen[1] - handler.seen[0] >= 0.5
+
+
+def test_stage_timeout_is_applied(stub):
+    handler, url = stub
+    handler.script.append((200, {}, 1.0))
+    client = client_for(url, timeouts={"draft": 0.3})
+    client.retries = 0
+    start = time.monotonic()
+    with pytest.raises(openai.APITimeoutError):
+        ask(client)
+    assert time.monotonic() - start < 0.9
+
+
+def test_hedge_returns_faster_duplicate(stub):
+    handler, url = stub
+    handler.script.append((200, {}, 2.0))
+    client = client_for(url, hedge=True)
+    client.hedge_default = 0.2
+    start = time.monotonic()
+    assert ask(client) == "ОШИБОК: 0"
+    assert time.monotonic() - start < 1.5
+    assert len(handler.seen) == 2
+
+
+class RecordingClient:
+    # Вместо настоящего клиента: запоминает параметры вызова
+    def __init__(self):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.chat = type("Chat", (), {"completions": self})()
+
+    def create(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+        return ChatCompletion.model_validate({
+            "id": "x", "object": "chat.completion", "created": 0, "model": "test",
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": "ok"}}],
+        })
+
+
+def test_stage_timeout_passed_to_client():
+    inner = RecordingClient()
+    client = ResilientClient(inner, timeouts={"draft": 7})
+    client.chat.completions.create(model="test", stage="draft", messages=[])
+    client.chat.completions.create(model="test", stage="verify", messages=[], timeout=3)
+    assert inner.calls[0]["timeout"] == 7
+    assert inner.calls[1]["timeout"] == 3
+
+
+def test_wrapper_kwargs_do_not_reach_client(tmp_path):
+    inner = RecordingClient()
+    client = CachedClient(ResilientClient(RateLimitedClient(inner, rpm=0)), LLMCache(str(tmp_path / "c.sqlite3")))
+    client.chat.completions.create(model="test", stage="draft", cache=False, messages=[])
+    client.chat.completions.create(model="test", stage="draft", messages=[])
+    assert len(inner.calls) == 2
+    assert all("stage" not in call and "cache" not in call for call in inner.calls)
+
+
+def test_metered_client_records_retries_and_duplicates(stub):
+    handler, url = stub
+    handler.script += [(503, {}, 0), (200, {}, 2.0)]
+    client = client_for(url, hedge=True)
+    client.hedge_default = 0.3
+    metrics = Metrics()
+    assert ask(MeteredClient(client, metrics)) == "ОШИБОК: 0"
+    time.sleep(2.0)  # дожидаемся опоздавшего ответа
+    records = [r for r in metrics.records if r["kind"] == "llm"]
+    assert [r.get("error") for r in records].count("InternalServerError") == 1
+    assert sum(1 for r in records if r.get("duplicate")) == 1
+    assert sum(1 for r in records if r["prompt_tokens"]) == 2
+
+
+def test_stream_requests_usage(stub):
+    _, url = stub
+    metrics = Metrics()
+    client = MeteredClient(client_for(url), metrics)
+    text = stream_text(client, model="test", stage="rewrite", messages=[{"role": "user", "content": "Пункт 1"}])
+    assert text
+    record = next(r for r in metrics.records if r["kind"] == "llm")
+    assert record["prompt_tokens"] and record["completion_tokens"]
+
+
+def test_stream_holds_in_flight_slot():
+    # Три потока при max_in_flight=1 идут друг за другом, а не вместе
+    server, url = start_fake_llm(0.3)
+    client = client_for(url, max_in_flight=1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=stream_text, kwargs=dict(
+        client=client, model="test", stage="draft", messages=[{"role": "user", "content": "Пункт 1"}]
+    )) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    server.shutdown()
+    assert time.monotonic() - start >= 0.85
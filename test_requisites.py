@@ -0,0 +1,58 @@
+import pytest
+
+from requisites import _nominative, local_requisites
+
+# Шапки контрактов в разном порядке слов; ожидаемые ФИО сторон (отсутствие ключа - спросим у ИИ)
+
+
+def fios(text):
+    found = local_requisites(text)
+    return {key: found[key] for key in ("customer_fio", "director") if key in found}
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Обычный порядок: "в лице" после "именуемое", ФИО в родительном падеже
+    ("ГБУ «Парк», именуемое в дальнейшем «Заказчик», в лице директора Сидорова Сидора Сидоровича, "
+     "действующего на основании Устава, с одной стороны, и ООО «Ромашка», именуемое в дальнейшем «Исполнитель», "
+     "в лице генерального директора Петровой Анны Ильиничны, действующей на основании Устава, с другой стороны, "
+     "заключили настоящий Контракт о нижеследующем:",
+     {"customer_fio": "Сидоров Сидор Сидорович", "director": "Петрова Анна Ильинична"}),
+    # То же в именительном падеже: ФИО заказчика не уходит исполнителю
+    ("ГБУ «Парк», именуемое в дальнейшем «Заказчик», в лице директора Сидоров Сидор Сидорович, "
+     "с одной стороны, и ООО «Ромашка», именуемое в дальнейшем «Исполнитель», в лице директора "
+     "Петров Петр Петрович, с другой стороны",
+     {"customer_fio": "Сидоров Сидор Сидорович", "director": "Петров Петр Петрович"}),
+    # Без "с одной стороны": граница - ", и" перед следующей стороной
+    ("ГБУ «Парк», именуемое «Заказчик», в лице директора Сидорова Сидора Сидоровича, и ООО «Ромашка», "
+     "именуемое «Исполнитель», в лице директора Ковальской Марии Павловны",
+     {"customer_fio": "Сидоров Сидор Сидорович", "director": "Ковальская Мария Павловна"}),
+    # "в лице" до "именуемое"
+    ("ГБУ «Парк», в лице директора Иванова Ивана Ивановича, именуемое «Заказчик», и ООО «Ромашка», "
+     "в лице генерального директора Петрова Петра Петровича, именуемое «Исполнитель»",
+     {"customer_fio": "Иванов Иван Иванович", "director": "Петров Петр Петрович"}),
+    # Граница между сторонами не видна - ФИО заказчика не угадываем
+    ("ГБУ «Парк», именуемое «Заказчик», в лице директора Сидорова Сидора Сидоровича, ООО «Ромашка», "
+     "именуемое «Исполнитель», в лице Петрова Петра Петровича",
+     {"director": "Петров Петр Петрович"}),
+    # ФИО вне "в лице" не учитываем
+    ("Директор Сидоров Сидор Сидорович\nГБУ «Парк», в лице директора Иванова Ивана Ивановича, именуемое «Заказчик»",
+     {"customer_fio": "Иванов Иван Иванович"}),
+])
+def test_party_fio(text, expected):
+    assert fios(text) == expected
+
+
+@pytest.mark.parametrize("genitive, nominative", [
+    ("Зайцева Алексея Дмитриевича", "Зайцев Алексей Дмитриевич"),
+    ("Шевченко Павла Сергеевича", "Шевченко Павел Сергеевич"),
+    ("Римского-Корсакова Николая Андреевича", "Римский-Корсаков Николай Андреевич"),
+    ("Кузнецовой Юлии Дмитриевны", "Кузнецова Юлия Дмитриевна"),
+    ("Шевчук Натальи Юрьевны", "Шевчук Наталья Юрьевна"),
+    ("Толстой Ольги Ивановны", None),
+])
+def test_nominative(genitive, nominative):
+    assert _nominative(genitive) == nominative
+
+
+def test_date_format():
+    assert local_requisites("г. Москва «5» марта 2025 г.")["contract_date"] == "05.03.2025"
@@ -0,0 +1,51 @@
+import math
+import re
+
+from segmenter import items_from_text, segment_items
+
+# --- БЮДЖЕТ ТОКЕНОВ ---
+# Грубая локальная оценка без токенизатора: кириллица ~2.5 символа на токен,
+# остальное ~4. Для разбивки и предупреждений этого достаточно.
+
+CYRILLIC_RE = re.compile(r"[А-Яа-яЁё]")
+
+# context - окно модели, output - максимум токенов ответа
+MODEL_BUDGETS = {
+    "anthropic/claude-3.5-sonnet": {"context": 200000, "output": 8192},
+}
+DEFAULT_BUDGET = {"context": 128000, "output": 4096}
+# Отчет примерно равен ТЗ по длине, берем запас
+OUTPUT_RATIO = 1.2
+
+
+def estimate_tokens(text):
+    cyr = len(CYRILLIC_RE.findall(text))
+    return math.ceil(cyr / 2.5 + (len(text) - cyr) / 4)
+
+
+def get_budget(model):
+    return MODEL_BUDGETS.get(model, DEFAULT_BUDGET)
+
+
+def check_budget(model, prompt, expected_output=0):
+    # Текст предупреждения, если запрос не влезает в бюджет модели, иначе None
+    budget = get_budget(model)
+    prompt_tokens = estimate_tokens(prompt)
+    if expected_output > budget["output"]:
+        return f"Ожидаемый ответ ~{expected_output} токенов больше лимита модели {budget['output']}"
+    if prompt_tokens + budget["output"] > budget["context"]:
+        return f"Запрос ~{prompt_tokens} токенов не помещается в окно модели {budget['context']}"
+    return None
+
+
+def chunk_for_budget(text, model, prompt_tokens=0, items=None):
+    # Режем ТЗ по границам пунктов так, чтобы каждый кусок вместе с инструкцией
+    # помещался во вход, а его переработанный вариант - в ответ модели
+    budget = get_budget(model)
+    max_tokens = min(budget["output"] / OUTPUT_RATIO, budget["context"] - budget["output"] - prompt_tokens)
+    total = estimate_tokens(text)
+    if total <= max_tokens:
+        return [text]
+    max_chars = max(1, int(max_tokens * len(text) / max(total, 1)))
+    # min_chars = max_chars: склеиваем соседние пункты, пока кусок влезает
+    return segment_items(items or items_from_text(text), max_chars, max_chars)
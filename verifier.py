@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import re
+
+# --- ЛОКАЛЬНАЯ ПРОВЕРКА ЧЕРНОВИКА ---
+# Решения: "ok" - ИИ-контроль не нужен, "fail" - ошибки найдены точно
+# (сразу исправление), "unsure" - отдаем на проверку ИИ.
+
+log = logging.getLogger(__name__)
+
+# Числа, даты, площади, номера: 10, 1.5, 12,5, 01.02.2025, 44-ФЗ
+NUMBER_RE = re.compile(r"\d+(?:[.,:/-]\d+)*")
+# Разделитель тысяч: пробел, неразрывный или узкий неразрывный пробел ("1 000" = "1000")
+THOUSANDS_RE = re.compile(r"(?<=\d)[ \u00a0\u202f](?=\d{3}(?!\d))")
+# Запрещенные слова долженствования и будущего времени
+FORBIDDEN_RE = re.compile(
+    r"\b(долж(?:ен|на|но|ны)|обязан(?:а|о|ы)?|буд(?:ет|ут|у|ем|ете|ешь)|необходимо|нужно|следует)\b",
+    re.IGNORECASE,
+)
+QUOTED_RE = re.compile(r"«([^»]+)»|\"([^\"]+)\"")
+# Слово с заглавной буквы не в начале предложения или аббревиатура
+NAME_RE = re.compile(r"(?<![.!?:\n]\s)(?<!^)\b([А-ЯЁA-Z][а-яёa-zА-ЯЁA-Z-]+)")
+SENTENCE_END = ".!?:;»)\"'"
+# Черновик заметно короче ТЗ - скорее всего, что-то потеряно
+MIN_LENGTH_RATIO = 0.6
+
+
+def _stem(word):
+    # Грубая основа: окончание может поменяться при смене времени
+    word = word.lower()
+    return word[:max(4, len(word) - 2)]
+
+
+def _names(text):
+    names = {m.group(1) or m.group(2) for m in QUOTED_RE.finditer(text)}
+    names.update(NAME_RE.findall(text))
+    return names
+
+
+def _numbers(text):
+    return set(NUMBER_RE.findall(THOUSANDS_RE.sub("", text)))
+
+
+def _digits(number):
+    return re.sub(r"\D", "", number)
+
+
+def local_check(section_text, draft):
+    problems, doubts = [], []
+    draft = draft or ""
+
+    src_numbers = _numbers(section_text)
+    out_numbers = _numbers(draft)
+    # Те же цифры с другими разделителями (1,5 / 1.5) - не ошибка, а повод для проверки ИИ
+    src_digits = {_digits(n) for n in src_numbers}
+    out_digits = {_digits(n) for n in out_numbers}
+    reformatted = sorted(n for n in src_numbers - out_numbers if _digits(n) in out_digits)
+    if reformatted:
+        doubts.append(f"Числа записаны иначе: {', '.join(reformatted)}")
+    missing = sorted(n for n in src_numbers - out_numbers if _digits(n) not in out_digits)
+    if missing:
+        problems.append(f"Потеряны числа/даты: {', '.join(missing)}")
+    extra = sorted(n for n in out_numbers - src_numbers if _digits(n) not in src_digits)
+    if extra:
+        problems.append(f"Появились числа, которых нет в ТЗ: {', '.join(extra)}")
+
+    forbidden = sorted({m.group(0).lower() for m in FORBIDDEN_RE.finditer(draft)})
+    if forbidden:
+        problems.append(f"Запрещенные слова: {', '.join(forbidden)}")
+
+    draft_lower = draft.lower()
+    lost = sorted(
+        n for n in _names(section_text)
+        if not all(_stem(w) in draft_lower for w in re.findall(r"\w+", n))
+    )
+    if lost:
+        doubts.append(f"Возможно, потеряны названия: {', '.join(lost)}")
+
+    if len(draft.strip()) < MIN_LENGTH_RATIO * len(section_text.strip()):
+        doubts.append("Черновик заметно короче ТЗ")
+    if draft.strip() and draft.strip()[-1] not in SENTENCE_END:
+        doubts.append("Текст обрывается")
+
+    decision = "fail" if problems else "unsure" if doubts else "ok"
+    log.info(
+        "local_check block=%s decision=%s problems=%s doubts=%s",
+        hashlib.sha1(section_text.encode("utf-8")).hexdigest()[:10], decision, problems, doubts,
+    )
+    return {"decision": decision, "problems": problems, "doubts": doubts}